@@ -41,6 +41,8 @@ class SpanAttributes:
     LLM_TOKEN_COUNT_PROMPT = "llm.token_count.prompt"
     LLM_TOKEN_COUNT_COMPLETION = "llm.token_count.completion"
     LLM_TOKEN_COUNT_TOTAL = "llm.token_count.total"
+    LLM_TOKEN_COUNT_PROMPT_CACHED = "llm.token_count.prompt_cached"  # Prompt tokens served from the provider's prompt cache
+    LLM_TOKEN_COUNT_PROMPT_UNCACHED = "llm.token_count.prompt_uncached"
     RETRIEVAL_SEARCH_TYPE = "retrieval.search_type"
     RETRIEVAL_ALGORITHM = "retrieval.algorithm"
     RETRIEVAL_K = "retrieval.k"
@@ -46,6 +46,8 @@ def no_op_span():
     class NoOpSpan:
         def set_attribute(self, key, value):
             pass
+        def set_attributes(self, attributes):
+            pass
         def set_status(self, status):
             pass
         def record_exception(self, exception):
@@ -213,6 +215,8 @@ def using_session(session_id: str = None, metadata: Dict[str, Any] = None):
         class NoOpSpan:
             def set_attribute(self, key, value):
                 pass
+            def set_attributes(self, attributes):
+                pass
             def set_status(self, status):
                 pass
             def record_exception(self, exception):
@@ -316,6 +320,8 @@ def create_span(name: str, attributes: Dict[str, Any] = None,
         class NoOpSpan:
             def set_attribute(self, key, value):
                 pass
+            def set_attributes(self, attributes):
+                pass
             def set_status(self, status):
                 pass
             def record_exception(self, exception):
@@ -350,6 +356,8 @@ def create_span(name: str, attributes: Dict[str, Any] = None,
         class NoOpSpan:
             def set_attribute(self, key, value):
                 pass
+            def set_attributes(self, attributes):
+                pass
             def set_status(self, status):
                 pass
             def record_exception(self, exception):
@@ -645,6 +653,10 @@ def is_telemetry_initialized() -> bool:
     """Check if telemetry has been initialized"""
     return _telemetry_initialized
 
+def is_tracer_ready() -> bool:
+    """Check if a Phoenix tracer is configured, i.e. create_span will record real spans"""
+    return PHOENIX_AVAILABLE and bool(_phoenix_session) and _tracer is not None
+
 # Backward compatibility alias
 def telemetry_initialized() -> bool:
     """Check if telemetry has been initialized (alias for is_telemetry_initialized)"""
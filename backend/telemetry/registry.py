@@ -7,9 +7,11 @@ in-memory storage or Redis for multi-worker support.
 """
 
 import abc
+import atexit
 import os
 import logging
 import sqlite3
+import threading
 import time
 from typing import Optional, Dict, Any, List
 from urllib.parse import urlparse, ParseResult
@@ -91,11 +93,11 @@ class MemorySpanRegistry(SpanRegistry):
         if session_id not in self._registry:
             self._registry[session_id] = {}
         
-        self._registry[session_id][qa_id] = str(span_id)
+        self._registry[session_id][qa_id] = span_id
         
         # Register with trace_id if provided
         if trace_id:
-            self._trace_registry[trace_id] = str(span_id)
+            self._trace_registry[trace_id] = span_id
         
         if qa_id and qa_id.endswith("_response"):
             logger.info(f"Registered response span: session={session_id}, qa_id={qa_id}, span_id={span_id}")
@@ -111,14 +113,14 @@ class MemorySpanRegistry(SpanRegistry):
             self._registry[session_id] = {}
         
         # Use None as special key for root span
-        self._registry[session_id][None] = str(span_id)
+        self._registry[session_id][None] = span_id
         # Also with string key for consistent API
-        self._registry[session_id]["root"] = str(span_id)
+        self._registry[session_id]["root"] = span_id
         
         # Register with trace_id if provided
         if trace_id:
-            self._trace_registry[trace_id] = str(span_id)
-            self._trace_registry[f"root:{trace_id}"] = str(span_id)
+            self._trace_registry[trace_id] = span_id
+            self._trace_registry[f"root:{trace_id}"] = span_id
         
         logger.info(f"Registered root span: session={session_id}, span_id={span_id}")
     
@@ -177,86 +179,126 @@ class MemorySpanRegistry(SpanRegistry):
 class SQLiteSpanRegistry(SpanRegistry):
     """SQLite-based implementation of span registry for development"""
 
-    def __init__(self, db_path="./telemetry_span_registry.db", key_expiry_seconds=86400):
+    def __init__(self, db_path="./telemetry_span_registry.db", key_expiry_seconds=86400,
+                 checkpoint_interval_seconds=300):
         self.db_path = db_path
         self.key_expiry_seconds = key_expiry_seconds
+        self.checkpoint_interval_seconds = checkpoint_interval_seconds
         self._conn = None
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
         self._ensure_connection()
         self._create_table()
+        self._checkpoint_thread = threading.Thread(
+            target=self._checkpoint_loop, name="span-registry-checkpoint", daemon=True
+        )
+        self._checkpoint_thread.start()
+        atexit.register(self.close)
         logger.info(f"Using SQLite span registry (development mode) at {self.db_path}")
 
     def _ensure_connection(self):
         if self._conn is None:
             self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
             self._conn.row_factory = sqlite3.Row # Access columns by name
+            self._conn.execute("PRAGMA journal_mode=WAL")
 
     def _create_table(self):
-        self._ensure_connection()
-        try:
-            with self._conn:
-                self._conn.execute("""
-                    CREATE TABLE IF NOT EXISTS span_mappings (
-                        key TEXT PRIMARY KEY,
-                        session_id TEXT NOT NULL,
-                        qa_id TEXT, 
-                        span_id TEXT NOT NULL,
-                        trace_id TEXT,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session_id ON span_mappings (session_id)")
-                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_id ON span_mappings (qa_id)")
-                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trace_id ON span_mappings (trace_id)")
-                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON span_mappings (timestamp)")
-        except sqlite3.Error as e:
-            logger.error(f"SQLite error creating table: {e}")
+        with self._lock:
+            self._ensure_connection()
+            try:
+                with self._conn:
+                    # Databases created before the rowid schema keyed rows on a
+                    # "{session_id}:{qa_id}" TEXT column; the mappings are short-lived,
+                    # so drop the old table rather than migrating it.
+                    columns = [row['name'] for row in self._conn.execute("PRAGMA table_info(span_mappings)")]
+                    if 'key' in columns:
+                        logger.info("Dropping legacy span_mappings table with TEXT primary key")
+                        self._conn.execute("DROP TABLE span_mappings")
+                    self._conn.execute("""
+                        CREATE TABLE IF NOT EXISTS span_mappings (
+                            id INTEGER PRIMARY KEY,
+                            session_id TEXT NOT NULL,
+                            qa_id TEXT,
+                            span_id TEXT NOT NULL,
+                            trace_id TEXT,
+                            timestamp INTEGER DEFAULT (strftime('%s', 'now'))
+                        )
+                    """)
+                    self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_session_qa ON span_mappings (session_id, qa_id)")
+                    self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trace_id ON span_mappings (trace_id)")
+                    self._conn.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON span_mappings (timestamp)")
+            except sqlite3.Error as e:
+                logger.error(f"SQLite error creating table: {e}")
 
     def _cleanup_expired_entries(self):
-        self._ensure_connection()
-        try:
-            with self._conn:
-                self._conn.execute(
-                    "DELETE FROM span_mappings WHERE timestamp < datetime('now', ?)",
-                    (f'-{self.key_expiry_seconds} seconds',)
-                )
-        except sqlite3.Error as e:
-            logger.error(f"SQLite error cleaning up expired entries: {e}")
+        with self._lock:
+            self._ensure_connection()
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "DELETE FROM span_mappings WHERE timestamp < ?",
+                        (int(time.time()) - self.key_expiry_seconds,)
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"SQLite error cleaning up expired entries: {e}")
+
+    def _checkpoint(self):
+        """Fold the WAL back into the main database file and truncate it."""
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                logger.error(f"SQLite error checkpointing WAL: {e}")
+
+    def _checkpoint_loop(self):
+        # Event.wait doubles as the sleep and the shutdown signal
+        while not self._closed.wait(self.checkpoint_interval_seconds):
+            self._checkpoint()
 
     def register_span(self, session_id: str, qa_id: str, span_id: str, trace_id: Optional[str] = None) -> None:
         if not session_id or not qa_id:
             logger.warning("Cannot register span without session_id and qa_id for SQLite registry")
             return
         
-        self._ensure_connection()
-        self._cleanup_expired_entries() # Periodically cleanup
-        key = f"{session_id}:{qa_id}"
-        try:
-            with self._conn:
-                self._conn.execute("""
-                    INSERT OR REPLACE INTO span_mappings (key, session_id, qa_id, span_id, trace_id, timestamp)
-                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (key, session_id, qa_id, str(span_id), trace_id))
-            logger.debug(f"SQLite Registered span: key={key}, span_id={span_id}")
-        except sqlite3.Error as e:
-            logger.error(f"SQLite error registering span {key}: {e}")
+        with self._lock:
+            self._ensure_connection()
+            self._cleanup_expired_entries() # Periodically cleanup
+            try:
+                with self._conn:
+                    self._conn.execute("""
+                        INSERT INTO span_mappings (session_id, qa_id, span_id, trace_id, timestamp)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(session_id, qa_id) DO UPDATE SET
+                            span_id = excluded.span_id,
+                            trace_id = excluded.trace_id,
+                            timestamp = excluded.timestamp
+                    """, (session_id, qa_id, span_id, trace_id, int(time.time())))
+                logger.debug(f"SQLite Registered span: session={session_id}, qa_id={qa_id}, span_id={span_id}")
+            except sqlite3.Error as e:
+                logger.error(f"SQLite error registering span {session_id}:{qa_id}: {e}")
 
     def find_span(self, session_id: str, qa_id: str) -> Optional[str]:
         if not session_id or not qa_id:
             return None
         
-        self._ensure_connection()
-        key = f"{session_id}:{qa_id}"
-        try:
-            with self._conn:
-                cursor = self._conn.execute("SELECT span_id FROM span_mappings WHERE key = ?", (key,))
-                row = cursor.fetchone()
-            if row:
-                logger.debug(f"SQLite Found span: key={key}, span_id={row['span_id']}")
-                return row['span_id']
-        except sqlite3.Error as e:
-            logger.error(f"SQLite error finding span {key}: {e}")
+        with self._lock:
+            self._ensure_connection()
+            try:
+                with self._conn:
+                    cursor = self._conn.execute(
+                        "SELECT span_id FROM span_mappings WHERE session_id = ? AND qa_id = ?",
+                        (session_id, qa_id)
+                    )
+                    row = cursor.fetchone()
+                if row:
+                    logger.debug(f"SQLite Found span: session={session_id}, qa_id={qa_id}, span_id={row['span_id']}")
+                    return row['span_id']
+            except sqlite3.Error as e:
+                logger.error(f"SQLite error finding span {session_id}:{qa_id}: {e}")
         
-        logger.warning(f"SQLite Could not find span: key={key}")
+        logger.warning(f"SQLite Could not find span: session={session_id}, qa_id={qa_id}")
         return None
 
     def register_root_span(self, session_id: str, span_id: str, trace_id: Optional[str] = None) -> None:
@@ -269,16 +311,17 @@ class SQLiteSpanRegistry(SpanRegistry):
     def find_span_by_trace(self, trace_id: str) -> Optional[str]:
         if not trace_id:
             return None
-        self._ensure_connection()
-        try:
-            with self._conn:
-                cursor = self._conn.execute("SELECT span_id FROM span_mappings WHERE trace_id = ? ORDER BY timestamp DESC LIMIT 1", (trace_id,))
-                row = cursor.fetchone()
-            if row:
-                logger.debug(f"SQLite Found span by trace_id={trace_id}, span_id={row['span_id']}")
-                return row['span_id']
-        except sqlite3.Error as e:
-            logger.error(f"SQLite error finding span by trace_id {trace_id}: {e}")
+        with self._lock:
+            self._ensure_connection()
+            try:
+                with self._conn:
+                    cursor = self._conn.execute("SELECT span_id FROM span_mappings WHERE trace_id = ? ORDER BY timestamp DESC LIMIT 1", (trace_id,))
+                    row = cursor.fetchone()
+                if row:
+                    logger.debug(f"SQLite Found span by trace_id={trace_id}, span_id={row['span_id']}")
+                    return row['span_id']
+            except sqlite3.Error as e:
+                logger.error(f"SQLite error finding span by trace_id {trace_id}: {e}")
         return None
 
     def find_root_span(self, session_id: str) -> Optional[str]:
@@ -292,21 +335,41 @@ class SQLiteSpanRegistry(SpanRegistry):
     def list_spans(self, session_id: str) -> Dict[str, str]:
         if not session_id:
             return {}
-        self._ensure_connection()
         spans = {}
-        try:
-            with self._conn:
-                cursor = self._conn.execute("SELECT qa_id, span_id FROM span_mappings WHERE session_id = ?", (session_id,))
-                for row in cursor.fetchall():
-                    if row['qa_id'] and row['qa_id'] != "_root_": # Exclude special root key from this list
-                        spans[row['qa_id']] = row['span_id']
-        except sqlite3.Error as e:
-            logger.error(f"SQLite error listing spans for session {session_id}: {e}")
+        with self._lock:
+            self._ensure_connection()
+            try:
+                with self._conn:
+                    cursor = self._conn.execute("SELECT qa_id, span_id FROM span_mappings WHERE session_id = ?", (session_id,))
+                    for row in cursor.fetchall():
+                        if row['qa_id'] and row['qa_id'] != "_root_": # Exclude special root key from this list
+                            spans[row['qa_id']] = row['span_id']
+            except sqlite3.Error as e:
+                logger.error(f"SQLite error listing spans for session {session_id}: {e}")
         return spans
 
-    def __del__(self):
-        if self._conn:
-            self._conn.close()
+    def close(self):
+        """Checkpoint the WAL and close the connection. Safe to call more than once."""
+        self._closed.set()
+        # Release the instance for garbage collection instead of holding it until exit
+        atexit.unregister(self.close)
+        if self._checkpoint_thread is not threading.current_thread():
+            self._checkpoint_thread.join()
+        with self._lock:
+            if self._conn is None:
+                return
+            self._checkpoint()
+            try:
+                self._conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"SQLite error closing span registry: {e}")
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 class RedisSpanRegistry(SpanRegistry):
@@ -355,11 +418,11 @@ class RedisSpanRegistry(SpanRegistry):
         # Always update in-memory fallback
         if session_id not in self._registry:
             self._registry[session_id] = {}
-        self._registry[session_id][qa_id] = str(span_id)
+        self._registry[session_id][qa_id] = span_id
         
         # Register with trace_id in memory if provided
         if trace_id:
-            self._trace_registry[trace_id] = str(span_id)
+            self._trace_registry[trace_id] = span_id
         
         # Try Redis if available
         if self._redis_available and self._pool:
@@ -369,17 +432,17 @@ class RedisSpanRegistry(SpanRegistry):
                 
                 # Store in main session hash
                 session_key = f"{self.key_prefix}{session_id}"
-                client.hset(session_key, qa_id, str(span_id))
+                client.hset(session_key, qa_id, span_id)
                 client.expire(session_key, self.key_expiry)
                 
                 # Store trace_id mapping if provided
                 if trace_id:
                     trace_key = f"{self.key_prefix}trace:{trace_id}"
-                    client.set(trace_key, str(span_id))
+                    client.set(trace_key, span_id)
                     client.expire(trace_key, self.key_expiry)
                     
                     # Also store in session hash for redundancy
-                    client.hset(session_key, f"trace:{trace_id}", str(span_id))
+                    client.hset(session_key, f"trace:{trace_id}", span_id)
                 
                 if qa_id and qa_id.endswith("_response"):
                     logger.info(f"Registered response span in Redis: session={session_id}, qa_id={qa_id}")
@@ -396,13 +459,13 @@ class RedisSpanRegistry(SpanRegistry):
         # Always update in-memory fallback
         if session_id not in self._registry:
             self._registry[session_id] = {}
-        self._registry[session_id][None] = str(span_id)
-        self._registry[session_id]["root"] = str(span_id)
+        self._registry[session_id][None] = span_id
+        self._registry[session_id]["root"] = span_id
         
         # Register with trace_id in memory if provided
         if trace_id:
-            self._trace_registry[trace_id] = str(span_id)
-            self._trace_registry[f"root:{trace_id}"] = str(span_id)
+            self._trace_registry[trace_id] = span_id
+            self._trace_registry[f"root:{trace_id}"] = span_id
         
         # Try Redis if available
         if self._redis_available and self._pool:
@@ -412,18 +475,18 @@ class RedisSpanRegistry(SpanRegistry):
                 
                 # Store in session hash
                 session_key = f"{self.key_prefix}{session_id}"
-                client.hset(session_key, "root", str(span_id))
+                client.hset(session_key, "root", span_id)
                 client.expire(session_key, self.key_expiry)
                 
                 # Store trace_id mapping if provided
                 if trace_id:
                     trace_key = f"{self.key_prefix}trace:{trace_id}"
-                    client.set(trace_key, str(span_id))
+                    client.set(trace_key, span_id)
                     client.expire(trace_key, self.key_expiry)
                     
                     # Mark as root
                     root_trace_key = f"{self.key_prefix}trace:root:{trace_id}"
-                    client.set(root_trace_key, str(span_id))
+                    client.set(root_trace_key, span_id)
                     client.expire(root_trace_key, self.key_expiry)
                 
                 logger.info(f"Registered root span in Redis: session={session_id}")
@@ -5,39 +5,158 @@ This module provides context managers and functions for creating spans
 for specific operations like LLM calls, retrieval, etc.
 """
 
+import functools
+import importlib
 import logging
-from datetime import datetime
-from typing import Dict, Any, Optional, ContextManager
+import os
+import sys
+import threading
+import types
+from typing import Dict, Any, Mapping, Optional, ContextManager, Tuple
 from contextlib import contextmanager
 import time
 
 from opentelemetry import trace
-from opentelemetry.trace import SpanKind
+from opentelemetry.trace import SpanKind, NonRecordingSpan, INVALID_SPAN_CONTEXT
 from opentelemetry.trace import format_span_id as otel_format_span_id
 from opentelemetry.context import get_current
 
-from .core import create_span, tracer
+from .core import create_span, tracer, is_telemetry_enabled, is_tracer_ready
 from .constants import SpanAttributes, OpenInferenceSpanKind, SpanNames
 
 logger = logging.getLogger(__name__)
 
-# Try to import get_current_span - fallback if not available
-try:
-    from openinference.instrumentation.langchain import get_current_span
-except ImportError:
-    # Fallback to OpenTelemetry's get_current_span with proper context handling
-    def get_current_span():
-        # Get current context first
-        current_context = get_current()
-        
-        # Try to get span from current context
-        current_span = trace.get_current_span(current_context)
+# Attribute names set on every span or by several helpers, interned once at import so
+# attribute dicts built here share one key object per name
+_ATTR_SESSION = sys.intern(SpanAttributes.SESSION_ID)
+_ATTR_QA = sys.intern(SpanAttributes.QA_ID)
+_ATTR_INPUT = sys.intern(SpanAttributes.INPUT_VALUE)
+_ATTR_SPAN_KIND = sys.intern(SpanAttributes.OPENINFERENCE_SPAN_KIND)
+_ATTR_START_NS = sys.intern("start_time_ns")
+_ATTR_SEQUENCE = sys.intern("span.sequence")
+_ATTR_ORDER = sys.intern("span.order")
+_ATTR_LLM_MODEL_NAME = sys.intern("openinference.llm.model_name")
+_ATTR_LLM_PROMPT = sys.intern("openinference.llm.prompt_template")
+_ATTR_LLM_TEMPERATURE = sys.intern("openinference.llm.temperature")
+
+# Read-only stand-in for an omitted attributes argument
+_EMPTY: Mapping[str, Any] = types.MappingProxyType({})
+
+# Span kinds, bound once at import
+_KIND_CHAIN = OpenInferenceSpanKind.CHAIN
+_KIND_LLM = OpenInferenceSpanKind.LLM
+_KIND_RETRIEVER = OpenInferenceSpanKind.RETRIEVER
+_KIND_HUMAN = OpenInferenceSpanKind.HUMAN
+_KIND_GUARD = OpenInferenceSpanKind.GUARDRAIL
+
+def _otel_get_current_span():
+    """Fallback to OpenTelemetry's get_current_span with proper context handling."""
+    # Get current context first
+    current_context = get_current()
+    
+    # Try to get span from current context
+    current_span = trace.get_current_span(current_context)
+    
+    # If no span in current context, try the global tracer
+    if not current_span or not current_span.is_recording():
+        current_span = trace.get_current_span()
         
-        # If no span in current context, try the global tracer
-        if not current_span or not current_span.is_recording():
-            current_span = trace.get_current_span()
-            
-        return current_span if current_span and current_span.is_recording() else None
+    return current_span if current_span and current_span.is_recording() else None
+
+
+@functools.lru_cache(maxsize=None)
+def _load_get_current_span():
+    """Resolve get_current_span on first use; openinference pulls in LangChain when imported."""
+    try:
+        from openinference.instrumentation.langchain import get_current_span
+        return get_current_span
+    except ImportError:
+        return _otel_get_current_span
+
+
+def get_current_span():
+    """Return the current LangChain-instrumented span, or the current recording OTel span."""
+    return _load_get_current_span()()
+
+
+@functools.lru_cache(maxsize=None)
+def _load_phoenix_helpers():
+    """
+    Resolve Phoenix's update_span and trace.get_current_span on first use.
+    
+    Returns:
+        Tuple of (update_span, get_current_span); either is None when unavailable
+    """
+    try:
+        import phoenix
+    except ImportError:
+        return None, None
+    return (
+        getattr(phoenix, "update_span", None),
+        getattr(getattr(phoenix, "trace", None), "get_current_span", None),
+    )
+
+# Hard switch for span creation, independent of TELEMETRY_ENABLED and user preference
+_TRACING_DISABLED = os.getenv("ATLAS_TRACING_DISABLED", "").lower() in ("true", "1", "yes")
+
+# Shared span yielded when nothing would be recorded
+_NOOP_SPAN = NonRecordingSpan(INVALID_SPAN_CONTEXT)
+
+# Per-(session_id, qa_id) span sequence counters. Plain dicts keep insertion
+# order, so re-inserting on each use leaves the least recently used pair first.
+_MAX_SEQUENCE_COUNTERS = 50
+_seq_counters: Dict[Tuple[str, str], int] = {}
+_seq_lock = threading.Lock()
+
+
+def _next_sequence(session_id: str, qa_id: str) -> int:
+    """Return the next span sequence number for a QA pair, evicting the oldest pairs."""
+    key = (session_id, qa_id)
+    with _seq_lock:
+        count = _seq_counters.pop(key, 0) + 1
+        _seq_counters[key] = count
+        if len(_seq_counters) > _MAX_SEQUENCE_COUNTERS:
+            del _seq_counters[next(iter(_seq_counters))]
+    return count
+
+
+# Longer string inputs are truncated before being attached as input.value
+_MAX_INPUT_ATTR_LEN = 4096
+
+
+def _set_input_value(attributes: Dict[str, Any], input_text: str) -> None:
+    """Set input.value, truncating long text and recording its original length."""
+    if len(input_text) > _MAX_INPUT_ATTR_LEN:
+        attributes[_ATTR_INPUT] = input_text[:_MAX_INPUT_ATTR_LEN]
+        attributes["input.truncated"] = True
+        attributes["input.original_length"] = len(input_text)
+    else:
+        attributes[_ATTR_INPUT] = input_text
+
+
+def _tracing_enabled() -> bool:
+    """Check whether spans created now would be recorded and exported."""
+    return not _TRACING_DISABLED and is_tracer_ready() and is_telemetry_enabled()
+
+
+def _current_parent_context(
+    _get_span_from_context=trace.get_current_span,
+    _set_span_in_context=trace.set_span_in_context
+):
+    """Return a context parented on the current span, or None if there is no valid current span."""
+    # Read the context once and reuse it for both the lookup and the parent context
+    ctx = get_current()
+    current_span = _get_span_from_context(ctx)
+    
+    # Fall back to the LangChain-instrumented span when the OTel context has none
+    if not current_span.get_span_context().is_valid:
+        current_span = get_current_span()
+    
+    if current_span and hasattr(current_span, 'get_span_context'):
+        current_context = current_span.get_span_context()
+        if hasattr(current_context, 'is_valid') and current_context.is_valid:
+            return _set_span_in_context(current_span, ctx)
+    return None
 
 
 @contextmanager
@@ -47,10 +166,11 @@ def trace_operation(
     session_id: str = None,
     qa_id: str = None,
     kind: SpanKind = SpanKind.CLIENT,
-    openinference_kind: str = OpenInferenceSpanKind.CHAIN,
+    openinference_kind: str = _KIND_CHAIN,
     input_data: Any = None,
     parent_context = None,
-    link_to_current: bool = False
+    link_to_current: bool = False,
+    _monotonic_ns=time.monotonic_ns
 ) -> ContextManager:
     """
     Create a span for a synchronous operation with consistent naming.
@@ -65,54 +185,40 @@ def trace_operation(
         input_data: Optional input data to record
         parent_context: Optional parent context to use
         link_to_current: Whether to link to the current span as parent
+        _monotonic_ns: Bound as a default for fast local lookup; not for callers
         
     Yields:
         The created span
     """
+    if not _tracing_enabled():
+        yield _NOOP_SPAN
+        return
+
     if attributes is None:
         attributes = {}
 
-
     # Add session and QA IDs if provided
     if session_id:
-        attributes[SpanAttributes.SESSION_ID] = session_id
+        attributes[_ATTR_SESSION] = session_id
     if qa_id:
-        attributes[SpanAttributes.QA_ID] = qa_id
+        attributes[_ATTR_QA] = qa_id
     
     # Add OpenInference attributes for Phoenix - use official standard only
-    attributes["openinference.span.kind"] = openinference_kind
+    attributes[_ATTR_SPAN_KIND] = openinference_kind
     
-    # Add timestamp - using high precision for proper ordering
-    attributes["timestamp"] = datetime.now().isoformat()
-    attributes["start_time"] = time.time()  # High precision start time for ordering
+    # Monotonic start time for ordering; the span itself already carries wall-clock start_time
+    attributes[_ATTR_START_NS] = _monotonic_ns()
     
     # Add explicit sequence number for reliable ordering within each query
     if session_id and qa_id:
-        # QA-specific sequence counter for this specific query
-        counter_key = f"_sequence_counter_{session_id}_{qa_id}"
-        if not hasattr(trace_operation, counter_key):
-            setattr(trace_operation, counter_key, 0)
-        current_count = getattr(trace_operation, counter_key) + 1
-        setattr(trace_operation, counter_key, current_count)
-        attributes["span.sequence"] = current_count
-        attributes["span.order"] = current_count  # Alternative name for Phoenix
-        
-        # Clean up old counters to prevent memory leaks (keep only recent ones)
-        if current_count == 1:  # First span in this QA, cleanup old ones
-            attrs_to_remove = [attr for attr in dir(trace_operation) 
-                             if attr.startswith("_sequence_counter_") and attr != counter_key]
-            # Remove oldest counters, keep only most recent 50
-            if len(attrs_to_remove) > 50:
-                for attr in attrs_to_remove[:-50]:  # Remove all but last 50
-                    try:
-                        delattr(trace_operation, attr)
-                    except AttributeError:
-                        pass
+        current_count = _next_sequence(session_id, qa_id)
+        attributes[_ATTR_SEQUENCE] = current_count
+        attributes[_ATTR_ORDER] = current_count  # Alternative name for Phoenix
     
     # Add input data if provided
     if input_data is not None:
         if isinstance(input_data, str):
-            attributes["input.value"] = input_data
+            _set_input_value(attributes, input_data)
         elif isinstance(input_data, dict):
             for key, value in input_data.items():
                 if isinstance(value, (str, int, float, bool)):
@@ -121,13 +227,7 @@ def trace_operation(
     # If link_to_current is True and no specific parent_context is provided, 
     # try to get the current span as parent
     if link_to_current and parent_context is None:
-        current_span = get_current_span()
-        
-        if current_span and hasattr(current_span, 'get_span_context'):
-            current_context = current_span.get_span_context()
-            if hasattr(current_context, 'is_valid') and current_context.is_valid:
-                # Use the current context more robustly
-                parent_context = trace.set_span_in_context(current_span, get_current())
+        parent_context = _current_parent_context()
     
     # Create and yield the span
     with create_span(
@@ -140,69 +240,162 @@ def trace_operation(
     ) as span:
         yield span
 
-def add_test_target_attributes(span, include_all=True):
+# Specialized forms of trace_operation for the span wrappers below. Each wrapper
+# always passes a string input, a fixed span kind and a fixed linking policy, so
+# these skip trace_operation's optional-argument checks and input type dispatch.
+# Callers own the attribute dict and have already checked _tracing_enabled().
+
+def _stamp_qa_attributes(attributes, session_id, qa_id, openinference_kind, input_text,
+                         _monotonic_ns=time.monotonic_ns):
+    """Add the span kind, start time, sequence number and input that trace_operation would add."""
+    attributes[_ATTR_SPAN_KIND] = openinference_kind
+    attributes[_ATTR_START_NS] = _monotonic_ns()
+    if session_id and qa_id:
+        current_count = _next_sequence(session_id, qa_id)
+        attributes[_ATTR_SEQUENCE] = current_count
+        attributes[_ATTR_ORDER] = current_count  # Alternative name for Phoenix
+    if input_text is not None:
+        _set_input_value(attributes, input_text)
+
+
+@contextmanager
+def _trace_llm(session_id: str, qa_id: str, attributes: Dict[str, Any], query: str):
+    """trace_operation for LLM generation: CLIENT span under the ambient context."""
+    _stamp_qa_attributes(attributes, session_id, qa_id, _KIND_LLM, query)
+    with create_span(
+        name=SpanNames.LLM_GENERATION,
+        attributes=attributes,
+        session_id=session_id,
+        kind=_KIND_LLM,
+        otel_kind=SpanKind.CLIENT
+    ) as span:
+        yield span
+
+
+@contextmanager
+def _trace_retriever(session_id: str, qa_id: str, attributes: Dict[str, Any], query: str):
+    """trace_operation for retrieval: CLIENT span under the ambient context."""
+    _stamp_qa_attributes(attributes, session_id, qa_id, _KIND_RETRIEVER, query)
+    with create_span(
+        name=SpanNames.CONTEXT_RETRIEVAL,
+        attributes=attributes,
+        session_id=session_id,
+        kind=_KIND_RETRIEVER,
+        otel_kind=SpanKind.CLIENT
+    ) as span:
+        yield span
+
+
+@contextmanager
+def _trace_human(session_id: str, qa_id: str, attributes: Dict[str, Any], query: str):
+    """trace_operation for a human query: CONSUMER span linked to the current span."""
+    _stamp_qa_attributes(attributes, session_id, qa_id, _KIND_HUMAN, query)
+    with create_span(
+        name=SpanNames.HUMAN_QUERY,
+        attributes=attributes,
+        session_id=session_id,
+        kind=_KIND_HUMAN,
+        otel_kind=SpanKind.CONSUMER,
+        parent_context=_current_parent_context()
+    ) as span:
+        yield span
+
+
+@contextmanager
+def _trace_guardrail(
+    operation_name: str,
+    session_id: str,
+    qa_id: str,
+    attributes: Dict[str, Any],
+    input_text: str,
+    parent_context=None
+):
+    """trace_operation for a guardrail: INTERNAL span under parent_context, else the current span."""
+    _stamp_qa_attributes(attributes, session_id, qa_id, _KIND_GUARD, input_text)
+    with create_span(
+        name=operation_name,
+        attributes=attributes,
+        session_id=session_id,
+        kind=_KIND_GUARD,
+        otel_kind=SpanKind.INTERNAL,
+        parent_context=parent_context if parent_context is not None else _current_parent_context()
+    ) as span:
+        yield span
+
+# Test target is fixed for the life of the process (env is loaded before telemetry is imported)
+_TEST_TARGET = os.getenv('TEST_TARGET', 'unknown')
+
+# Target module attributes with dedicated span keys; all other upper-case
+# primitives are exported as test_target.<name>
+_TARGET_ATTR_KEYS = {
+    'TARGET_ID': ("test_target.id",),
+    'MODEL': (SpanAttributes.LLM_MODEL, "test_target.model"),
+}
+_TARGET_DETAIL_KEYS = {
+    'EMBEDDING_MODEL': "test_target.embedding_model",
+    'SEARCH_TYPE': "test_target.search_type",
+    'SEARCH_K': "test_target.search_k",
+    'FETCH_K': "test_target.fetch_k",
+    'CITATION_LIMIT': "test_target.citation_limit",
+    'SYSTEM_PROMPT': "test_target.system_prompt",
+}
+
+
+@functools.lru_cache(maxsize=8)
+def _target_attrs(test_target: str, include_all: bool) -> Tuple[Tuple[str, Any], ...]:
     """
-    Add test target configuration attributes to a span.
+    Resolve the span attributes for a test target once per process.
     
     Args:
-        span: The span to add attributes to
+        test_target: Name of the target module under backend.targets
         include_all: Whether to include all test target configuration
+        
+    Returns:
+        Tuple of (attribute_name, value) pairs
     """
-    # Get current test target from environment
-    import os
-    test_target = os.getenv('TEST_TARGET', 'unknown')
+    attrs = [(SpanAttributes.TEST_TARGET, test_target)]
     
-    # Add test target to span
-    span.set_attribute(SpanAttributes.TEST_TARGET, test_target)
-    
-    # Try to import the test target module
     try:
-        import importlib
         target_module = importlib.import_module(f"backend.targets.{test_target}")
         
         # Add basic attributes with consolidated naming (remove duplication)
-        if hasattr(target_module, 'TARGET_ID'):
-            span.set_attribute("test_target.id", target_module.TARGET_ID)
-        
-        if hasattr(target_module, 'MODEL'):
-            span.set_attribute(SpanAttributes.LLM_MODEL, target_module.MODEL)
-            span.set_attribute("test_target.model", target_module.MODEL)
+        for attr_name, keys in _TARGET_ATTR_KEYS.items():
+            if hasattr(target_module, attr_name):
+                value = getattr(target_module, attr_name)
+                attrs.extend((key, value) for key in keys)
         
         # Add detailed configuration if requested
         if include_all:
-            if hasattr(target_module, 'EMBEDDING_MODEL'):
-                span.set_attribute("test_target.embedding_model", target_module.EMBEDDING_MODEL)
-            
-            if hasattr(target_module, 'SEARCH_TYPE'):
-                span.set_attribute("test_target.search_type", target_module.SEARCH_TYPE)
-            
-            if hasattr(target_module, 'SEARCH_K'):
-                span.set_attribute("test_target.search_k", target_module.SEARCH_K)
-            
-            if hasattr(target_module, 'FETCH_K'):
-                span.set_attribute("test_target.fetch_k", target_module.FETCH_K)
-            
-            if hasattr(target_module, 'CITATION_LIMIT'):
-                span.set_attribute("test_target.citation_limit", target_module.CITATION_LIMIT)
-            
-            if hasattr(target_module, 'SYSTEM_PROMPT'):
-                span.set_attribute("test_target.system_prompt", target_module.SYSTEM_PROMPT)
+            for attr_name, key in _TARGET_DETAIL_KEYS.items():
+                if hasattr(target_module, attr_name):
+                    attrs.append((key, getattr(target_module, attr_name)))
             
             # Add any other target attributes that might be useful
             for attr_name in dir(target_module):
-                if attr_name.isupper() and not attr_name.startswith('__') and attr_name not in [
-                    'TARGET_ID', 'MODEL', 'EMBEDDING_MODEL', 'SEARCH_TYPE', 
-                    'SEARCH_K', 'FETCH_K', 'CITATION_LIMIT', 'SYSTEM_PROMPT'
-                ]:
+                if attr_name.isupper() and not attr_name.startswith('__') and attr_name not in _TARGET_ATTR_KEYS \
+                        and attr_name not in _TARGET_DETAIL_KEYS:
                     try:
                         value = getattr(target_module, attr_name)
                         if isinstance(value, (str, int, float, bool)):
-                            span.set_attribute(f"test_target.{attr_name.lower()}", value)
+                            attrs.append((f"test_target.{attr_name.lower()}", value))
                     except Exception as e:
                         logger.debug(f"Could not add test target attribute {attr_name}: {e}")
         
     except Exception as e:
         logger.warning(f"Failed to add test target attributes: {e}")
+    
+    return tuple(attrs)
+
+
+def add_test_target_attributes(span, include_all=True):
+    """
+    Add test target configuration attributes to a span.
+    
+    Args:
+        span: The span to add attributes to
+        include_all: Whether to include all test target configuration
+    """
+    span.set_attributes(dict(_target_attrs(_TEST_TARGET, include_all)))
 
 def record_model_attributes(span, model_name, latency_ms=None, prompt=None, temperature=None):
     """
@@ -215,28 +408,25 @@ def record_model_attributes(span, model_name, latency_ms=None, prompt=None, temp
         prompt: Prompt used (if available)
         temperature: Temperature setting (if known)
     """
-    # Set required OpenInference attributes using the proper nested structure
-    span.set_attribute("openinference", {
-        "span": {
-            "kind": OpenInferenceSpanKind.LLM
-        },
-        "llm": {
-            "model_name": model_name
-        }
-    })
+    # Set required OpenInference attributes as flat dotted keys (OTel attributes must be primitives)
+    attrs = {
+        _ATTR_SPAN_KIND: _KIND_LLM,
+        _ATTR_LLM_MODEL_NAME: model_name,
+        # Add standard ATLAS attributes
+        SpanAttributes.LLM_MODEL: model_name
+    }
     
     # Set optional attributes if provided
     if latency_ms is not None:
-        span.set_attribute("openinference.llm.latency_ms", latency_ms)
+        attrs["openinference.llm.latency_ms"] = latency_ms
     
     if prompt is not None:
-        span.set_attribute("openinference.llm.prompt_template", prompt)
+        attrs[_ATTR_LLM_PROMPT] = prompt
     
     if temperature is not None:
-        span.set_attribute("openinference.llm.temperature", temperature)
+        attrs[_ATTR_LLM_TEMPERATURE] = temperature
     
-    # Add standard ATLAS attributes
-    span.set_attribute(SpanAttributes.LLM_MODEL, model_name)
+    span.set_attributes(attrs)
 
 @contextmanager
 def create_llm_span(
@@ -263,34 +453,29 @@ def create_llm_span(
     Returns:
         Context manager for the LLM span
     """
-    if attributes is None:
-        attributes = {}
-    
-    # Add required OpenInference attributes
+    if not _tracing_enabled():
+        yield _NOOP_SPAN
+        return
+
+    # Build the span's attribute dict once, caller attributes first so the
+    # required OpenInference attributes win; _trace_llm adds its own keys in place
     span_attributes = {
-        **attributes,
-        SpanAttributes.SESSION_ID: session_id,
-        SpanAttributes.QA_ID: qa_id,
-        "openinference.llm.model_name": model_name,
-        "openinference.llm.input": query
+        **(attributes or _EMPTY),
+        _ATTR_SESSION: session_id,
+        _ATTR_QA: qa_id,
+        _ATTR_LLM_MODEL_NAME: model_name,
+        "openinference.llm.input": query,
     }
     
     # Add optional attributes if provided
     if prompt is not None:
-        span_attributes["openinference.llm.prompt_template"] = prompt
+        span_attributes[_ATTR_LLM_PROMPT] = prompt
     
     if temperature is not None:
-        span_attributes["openinference.llm.temperature"] = temperature
+        span_attributes[_ATTR_LLM_TEMPERATURE] = temperature
     
     # Create span with proper kind
-    with trace_operation(
-        SpanNames.LLM_GENERATION,
-        attributes=span_attributes,
-        session_id=session_id,
-        qa_id=qa_id,
-        openinference_kind=OpenInferenceSpanKind.LLM,
-        input_data=query
-    ) as span:
+    with _trace_llm(session_id, qa_id, span_attributes, query) as span:
         # Add test target attributes
         add_test_target_attributes(span)
         yield span
@@ -318,16 +503,18 @@ def create_retriever_span(
     Returns:
         Context manager for the retriever span
     """
-    if attributes is None:
-        attributes = {}
-    
-    # Add required OpenInference attributes
+    if not _tracing_enabled():
+        yield _NOOP_SPAN
+        return
+
+    # Build the span's attribute dict once, caller attributes first so the
+    # required OpenInference attributes win; _trace_retriever adds its own keys in place
     span_attributes = {
-        **attributes,
-        SpanAttributes.SESSION_ID: session_id,
-        SpanAttributes.QA_ID: qa_id,
+        **(attributes or _EMPTY),
+        _ATTR_SESSION: session_id,
+        _ATTR_QA: qa_id,
         "openinference.retriever.type": retriever_type,
-        "openinference.retriever.query": query
+        "openinference.retriever.query": query,
     }
     
     # Add optional attributes if provided
@@ -335,14 +522,7 @@ def create_retriever_span(
         span_attributes["openinference.retriever.top_k"] = top_k
     
     # Create span with proper kind
-    with trace_operation(
-        SpanNames.CONTEXT_RETRIEVAL,
-        attributes=span_attributes,
-        session_id=session_id,
-        qa_id=qa_id,
-        openinference_kind=OpenInferenceSpanKind.RETRIEVER,
-        input_data=query
-    ) as span:
+    with _trace_retriever(session_id, qa_id, span_attributes, query) as span:
         # Add test target attributes
         add_test_target_attributes(span)
         yield span
@@ -369,42 +549,22 @@ def create_human_query_span(
     Returns:
         Context manager for the human query span
     """
-    if attributes is None:
-        attributes = {}
-    
-    # Add required OpenInference attributes for human interactions
+    if not _tracing_enabled():
+        yield _NOOP_SPAN
+        return
+
+    # Build the span's attribute dict once, caller attributes first so the required
+    # attributes win; input.value and the span kind are added by _trace_human.
+    # "role" matches the "assistant" role set on LLM spans.
     span_attributes = {
-        **attributes,
-        # Session identifiers
-        SpanAttributes.SESSION_ID: session_id,
-        "session.id": session_id,
-        SpanAttributes.QA_ID: qa_id,
-        
-        # User input
-        "input.value": query,
-        
-        # Span classification
-        "openinference.span.kind": OpenInferenceSpanKind.HUMAN,
-        "openinference.human.input": query,
+        **(attributes or _EMPTY),
+        _ATTR_SESSION: session_id,
+        _ATTR_QA: qa_id,
         "role": "human",
-        "human.role": "user",
-        "human.description": "User query that initiates the RAG process",
-        
-        # Timestamp
-        "timestamp": datetime.now().isoformat()
     }
     
-    # Create span with proper kind and ensure it's linked to current context (parent)
-    with trace_operation(
-        SpanNames.HUMAN_QUERY,
-        attributes=span_attributes,
-        session_id=session_id,
-        qa_id=qa_id,
-        openinference_kind=OpenInferenceSpanKind.HUMAN,
-        input_data=query,
-        kind=SpanKind.CONSUMER,  # CONSUMER kind for incoming requests
-        link_to_current=True  # Explicitly link to current context (parent)
-    ) as span:
+    # CONSUMER span for the incoming request, linked to the current context (parent)
+    with _trace_human(session_id, qa_id, span_attributes, query) as span:
         # Register this span for the qa_id
         current_span_id = otel_format_span_id(span.get_span_context().span_id)
         register_span(session_id, qa_id, current_span_id)
@@ -438,64 +598,44 @@ def create_guardrail_span(
     Returns:
         Context manager for the guardrail span
     """
-    if attributes is None:
-        attributes = {}
-    
-    # Add required OpenInference attributes for guardrails
+    if not _tracing_enabled():
+        yield _NOOP_SPAN
+        return
+
+    # Build the span's attribute dict once, caller attributes first so the required
+    # attributes win; input.value and the span kind are added by _trace_guardrail
     span_attributes = {
-        **attributes,
-        # Session identifiers
-        SpanAttributes.SESSION_ID: session_id,
-        SpanAttributes.QA_ID: qa_id,
-        
-        # Input text
-        SpanAttributes.INPUT_VALUE: input_text,
+        **(attributes or _EMPTY),
+        _ATTR_SESSION: session_id,
+        _ATTR_QA: qa_id,
         "query_length": len(input_text),
-        
         # Guardrail metadata
         "guardrail.type": guardrail_type,
         "guardrail.enabled": enabled,
-        
-        # Span classification
-        "openinference.span.kind": OpenInferenceSpanKind.GUARDRAIL,
-        
-        # Timestamp
-        "timestamp": datetime.now().isoformat()
     }
     
-    # Create span with proper kind and explicit parent context if provided
-    with trace_operation(
+    # Use the explicit parent context if provided, otherwise link to the current span
+    with _trace_guardrail(
         f"com.atlas.guardrails.{guardrail_type}",
-        attributes=span_attributes,
-        session_id=session_id,
-        qa_id=qa_id,
-        openinference_kind=OpenInferenceSpanKind.GUARDRAIL,
-        input_data=input_text,
-        kind=SpanKind.INTERNAL,
-        parent_context=parent_context,  # Use explicit parent context
-        link_to_current=False if parent_context else True  # Only link to current if no explicit parent
+        session_id,
+        qa_id,
+        span_attributes,
+        input_text,
+        parent_context=parent_context
     ) as span:
         yield span
 
 # Import the span registry
 from .registry import span_registry
 
-# Legacy support - redirect to registry for backward compatibility
-_span_registry = {}
-
-# Flag to indicate we're using the new registry system
-_using_registry = True
-
 def get_current_span_id():
     """Get the current span ID as a hex string."""
-    try:
-        # Try Phoenix native first
-        import phoenix as px
-        current_span = px.trace.get_current_span()
+    # Try Phoenix native first
+    phoenix_get_current_span = _load_phoenix_helpers()[1]
+    if phoenix_get_current_span is not None:
+        current_span = phoenix_get_current_span()
         if current_span:
             return str(current_span.span_id)
-    except ImportError:
-        pass
     
     # Fallback to OpenTelemetry
     current_span = get_current_span()
@@ -503,7 +643,7 @@ def get_current_span_id():
         return otel_format_span_id(current_span.get_span_context().span_id)
     return None
 
-def register_span(session_id, qa_id, span_id, trace_id=None):
+def register_span(session_id: str, qa_id: str, span_id: str, trace_id: Optional[str] = None):
     """
     Register a span ID for a specific session and QA pair.
     This allows finding spans later for feedback association.
@@ -511,48 +651,18 @@ def register_span(session_id, qa_id, span_id, trace_id=None):
     Args:
         session_id: Session identifier
         qa_id: Question-answer identifier
-        span_id: Span identifier
+        span_id: Span identifier, already formatted as a string by the caller
         trace_id: Optional trace identifier for Phoenix correlation
     """
-    # Use the registry for registration
-    span_registry.register_span(session_id, qa_id, str(span_id), trace_id)
-    
-    # For backward compatibility, also update in-memory registry
-    if not _using_registry:
-        global _span_registry
-        
-        if not session_id:
-            logger.warning("Cannot register span without session_id")
-            return
-            
-        # Initialize session entry if needed
-        if session_id not in _span_registry:
-            _span_registry[session_id] = {}
-        
-        # Store the span ID as string
-        if qa_id is not None:
-            span_id_str = str(span_id)
-            _span_registry[session_id][qa_id] = span_id_str
-
-def find_qa_span_id(session_id, qa_id):
-    """
-    Find a span ID for a specific session and QA pair.
-    """
-    # Use registry to find span
-    return span_registry.find_span(session_id, qa_id)
+    span_registry.register_span(session_id, qa_id, span_id, trace_id)
 
-def find_session_root_span_id(session_id: str) -> Optional[str]:
-    """
-    Find the root span ID for a session.
-    
-    Args:
-        session_id: Session ID
-        
-    Returns:
-        Root span ID if found, None otherwise
-    """
-    # Use registry to find root span
-    return span_registry.find_root_span(session_id)
+# Registry lookups are exposed directly as the registry's bound methods:
+#   find_qa_span_id(session_id, qa_id) -> span ID for a session and QA pair, or None
+#   find_session_root_span_id(session_id) -> root span ID for a session, or None
+#   find_span_by_trace_id(trace_id) -> span ID registered for a trace, or None
+find_qa_span_id = span_registry.find_span
+find_session_root_span_id = span_registry.find_root_span
+find_span_by_trace_id = span_registry.find_span_by_trace
 
 
 def register_session_root_span(session_id: str, span_id: str, trace_id: Optional[str] = None):
@@ -561,23 +671,21 @@ def register_session_root_span(session_id: str, span_id: str, trace_id: Optional
     
     Args:
         session_id: Session identifier
-        span_id: Span identifier
+        span_id: Span identifier, already formatted as a string by the caller
         trace_id: Optional trace identifier for Phoenix correlation
     """
-    span_registry.register_root_span(session_id, str(span_id), trace_id)
+    span_registry.register_root_span(session_id, span_id, trace_id)
 
 
-def find_span_by_trace_id(trace_id: str) -> Optional[str]:
+@functools.lru_cache(maxsize=None)
+def _load_tracer_get_span():
     """
-    Find a span by its trace ID.
+    Probe once for a tracer that can look spans up by ID (standard OTel tracers cannot).
     
-    Args:
-        trace_id: Trace identifier for Phoenix correlation
-        
-    Returns:
-        Span ID if found, None otherwise
+    Resolved on first feedback update rather than at import, because the tracer
+    provider is only installed by initialize_telemetry().
     """
-    return span_registry.find_span_by_trace(trace_id)
+    return getattr(trace.get_tracer(__name__), 'get_span', None)
 
 
 def update_span_attributes(span_id: str, attributes: Dict[str, Any]) -> bool:
@@ -598,36 +706,25 @@ def update_span_attributes(span_id: str, attributes: Dict[str, Any]) -> bool:
         
     try:
         # Attempt 1: Try using Phoenix API if available
-        try:
-            import phoenix
-            if hasattr(phoenix, 'update_span'):
-                # Direct Phoenix API call if available
-                success = phoenix.update_span(span_id, attributes)
-                if success:
-                    logger.info(f"Updated span {span_id} using Phoenix API")
-                    return True
-        except ImportError:
-            pass
+        phoenix_update_span = _load_phoenix_helpers()[0]
+        if phoenix_update_span is not None:
+            # Direct Phoenix API call if available
+            success = phoenix_update_span(span_id, attributes)
+            if success:
+                logger.info(f"Updated span {span_id} using Phoenix API")
+                return True
             
         # Attempt 2: Try OpenTelemetry's get_tracer().get_span method if available
-        try:
-            from opentelemetry import trace
-            tracer = trace.get_tracer(__name__)
-            if hasattr(tracer, 'get_span'):
-                span = tracer.get_span(span_id)
-                if span:
-                    for key, value in attributes.items():
-                        span.set_attribute(key, value)
-                    logger.info(f"Updated span {span_id} using OpenTelemetry API")
-                    return True
-        except (ImportError, AttributeError):
-            pass
+        tracer_get_span = _load_tracer_get_span()
+        if tracer_get_span is not None:
+            span = tracer_get_span(span_id)
+            if span:
+                span.set_attributes(attributes)
+                logger.info(f"Updated span {span_id} using OpenTelemetry API")
+                return True
             
         # Attempt 3: Create a feedback.annotator span that manually sets these attributes
         # on its parent span with explicit links
-        from .core import create_span
-        from .constants import SpanNames, OpenInferenceSpanKind
-        
         with create_span(
             name=f"{SpanNames.FEEDBACK_ANNOTATOR}",
             attributes={
@@ -638,13 +735,16 @@ def update_span_attributes(span_id: str, attributes: Dict[str, Any]) -> bool:
             }
         ) as annotator_span:
             # Add special attributes that Phoenix might recognize
-            annotator_span.set_attribute("links.target_span_id", span_id)
-            annotator_span.set_attribute("links.relationship", "annotates")
-            annotator_span.set_attribute("target.span_id", span_id)
+            annotator_attrs = {
+                "links.target_span_id": span_id,
+                "links.relationship": "annotates",
+                "target.span_id": span_id
+            }
             
             # Add all the feedback attributes
             for key, value in attributes.items():
-                annotator_span.set_attribute(f"target.{key}", value)
+                annotator_attrs[f"target.{key}"] = value
+            annotator_span.set_attributes(annotator_attrs)
                 
             logger.info(f"Created annotator span for {span_id}")
             return True
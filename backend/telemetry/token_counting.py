@@ -4,16 +4,77 @@ Provider-agnostic token counting utilities for Phoenix telemetry.
 This module provides token counting functionality that works across different LLM providers
 (OpenAI, Anthropic, Ollama, Bedrock, etc.) with appropriate fallbacks.
 """
+import functools
 import logging
-from typing import Dict, Optional, Any, Union, Tuple
+import threading
+from typing import Dict, List, NamedTuple, Optional, Any, Union, Tuple
 import re
 
+from .constants import SpanAttributes
+
 logger = logging.getLogger(__name__)
 
 # Token estimation constants (rough approximations)
-AVG_CHARS_PER_TOKEN = 4  # Average characters per token across most tokenizers
+_LOG2_CHARS_PER_TOKEN = 2  # Character estimates divide by shifting right
+AVG_CHARS_PER_TOKEN = 1 << _LOG2_CHARS_PER_TOKEN  # Average characters per token across most tokenizers
 AVG_WORDS_TO_TOKENS = 1.3  # Average word-to-token ratio
 
+# Whitespace-delimited words, counted without building a list of them
+_WORD_RE = re.compile(r"\S+")
+
+# Field names checked, in order, for each token type in unknown response formats
+_FIELD_MAP: Dict[str, Tuple[str, ...]] = {
+    'prompt_tokens': ('prompt_tokens', 'input_tokens', 'prompt_eval_count'),
+    'completion_tokens': ('completion_tokens', 'output_tokens', 'eval_count'),
+    'total_tokens': ('total_tokens', 'total'),
+}
+
+
+
+class TokenCounts(NamedTuple):
+    """Token counts for one LLM call; the cache fields are None unless the provider reports them."""
+    prompt: int = 0
+    completion: int = 0
+    total: int = 0
+    cached: Optional[int] = None
+    uncached_prompt: Optional[int] = None
+    
+    def as_dict(self) -> Dict[str, int]:
+        """Return the counts in the dict format used by the public TokenCounter methods."""
+        tokens = {
+            "prompt_tokens": self.prompt,
+            "completion_tokens": self.completion,
+            "total_tokens": self.total,
+        }
+        if self.cached is not None:
+            tokens["cached_tokens"] = self.cached
+            tokens["uncached_prompt_tokens"] = self.uncached_prompt
+        return tokens
+
+
+_NO_TOKENS = TokenCounts()
+
+# Process-wide tiktoken encoder, loaded on first use and shared by all counters
+_TIKTOKEN_ENCODER = None
+_TIKTOKEN_TRIED = False
+_TIKTOKEN_LOCK = threading.Lock()
+
+
+def _get_tiktoken_encoder():
+    """Return the shared cl100k_base encoder, or None if tiktoken is unavailable."""
+    global _TIKTOKEN_ENCODER, _TIKTOKEN_TRIED
+    if not _TIKTOKEN_TRIED:
+        with _TIKTOKEN_LOCK:
+            if not _TIKTOKEN_TRIED:
+                try:
+                    import tiktoken
+                    _TIKTOKEN_ENCODER = tiktoken.get_encoding("cl100k_base")  # GPT-4 encoding
+                    logger.debug("Loaded tiktoken encoder for token estimation")
+                except ImportError:
+                    logger.warning("tiktoken not available - using character-based estimation")
+                _TIKTOKEN_TRIED = True
+    return _TIKTOKEN_ENCODER
+
 
 class TokenCounter:
     """Provider-agnostic token counting utility."""
@@ -26,19 +87,12 @@ class TokenCounter:
             provider: LLM provider name (openai, anthropic, ollama, etc.)
         """
         self.provider = (provider or "").upper()
-        self._tiktoken_encoder = None
+        # Unknown providers fall back to generic extraction
+        self._extractor = self._DISPATCH.get(self.provider, TokenCounter._extract_generic_tokens)
         
     def get_tiktoken_encoder(self):
-        """Get tiktoken encoder for OpenAI-style estimation (lazy loading)."""
-        if self._tiktoken_encoder is None:
-            try:
-                import tiktoken
-                self._tiktoken_encoder = tiktoken.get_encoding("cl100k_base")  # GPT-4 encoding
-                logger.debug("Loaded tiktoken encoder for token estimation")
-            except ImportError:
-                logger.warning("tiktoken not available - using character-based estimation")
-                self._tiktoken_encoder = False
-        return self._tiktoken_encoder if self._tiktoken_encoder is not False else None
+        """Get the shared tiktoken encoder for OpenAI-style estimation (lazy loading)."""
+        return _get_tiktoken_encoder()
     
     def extract_tokens_from_response(self, response: Any) -> Dict[str, int]:
         """
@@ -48,116 +102,133 @@ class TokenCounter:
             response: LLM response object (format varies by provider)
             
         Returns:
-            Dict with prompt_tokens, completion_tokens, total_tokens (0 if not available)
+            Dict with prompt_tokens, completion_tokens, total_tokens (0 if not available),
+            plus cached_tokens and uncached_prompt_tokens when the provider reports them
         """
-        tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-        
+        return self._extract_counts(response).as_dict()
+    
+    def _extract_counts(self, response: Any) -> "TokenCounts":
+        """Extract token counts from an LLM response, or zero counts on failure."""
         try:
-            if self.provider == "OPENAI":
-                tokens.update(self._extract_openai_tokens(response))
-            elif self.provider == "ANTHROPIC":
-                tokens.update(self._extract_anthropic_tokens(response))
-            elif self.provider == "OLLAMA":
-                tokens.update(self._extract_ollama_tokens(response))
-            else:
-                # Try generic extraction for unknown providers
-                tokens.update(self._extract_generic_tokens(response))
-                
+            return self._extractor(self, response)
         except Exception as e:
             logger.warning(f"Failed to extract tokens from {self.provider} response: {e}")
-            
-        return tokens
+            return _NO_TOKENS
     
-    def _extract_openai_tokens(self, response: Any) -> Dict[str, int]:
-        """Extract tokens from OpenAI response format."""
-        tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    def _extract_openai_tokens(self, response: Any) -> "TokenCounts":
+        """Extract tokens from OpenAI response format, including prompt-cache hits."""
+        cached = None
         
         # Handle streaming response with usage information
         if hasattr(response, 'usage') and response.usage:
             usage = response.usage
-            tokens["prompt_tokens"] = getattr(usage, 'prompt_tokens', 0)
-            tokens["completion_tokens"] = getattr(usage, 'completion_tokens', 0)
-            tokens["total_tokens"] = getattr(usage, 'total_tokens', 0)
+            prompt = getattr(usage, 'prompt_tokens', 0)
+            completion = getattr(usage, 'completion_tokens', 0)
+            total = getattr(usage, 'total_tokens', 0)
+            details = getattr(usage, 'prompt_tokens_details', None)
+            if details is not None:
+                cached = getattr(details, 'cached_tokens', 0) or 0
         
         # Handle dictionary format
         elif isinstance(response, dict):
             usage = response.get('usage', {})
-            tokens["prompt_tokens"] = usage.get('prompt_tokens', 0)
-            tokens["completion_tokens"] = usage.get('completion_tokens', 0)
-            tokens["total_tokens"] = usage.get('total_tokens', 0)
-            
-        return tokens
+            prompt = usage.get('prompt_tokens', 0)
+            completion = usage.get('completion_tokens', 0)
+            total = usage.get('total_tokens', 0)
+            details = usage.get('prompt_tokens_details')
+            if details is not None:
+                cached = details.get('cached_tokens', 0) or 0
+        
+        else:
+            return _NO_TOKENS
+        
+        if cached is None:
+            return TokenCounts(prompt, completion, total)
+        # Cached prompt tokens are part of prompt_tokens; split out the billable remainder
+        return TokenCounts(prompt, completion, total, cached, prompt - cached)
     
-    def _extract_anthropic_tokens(self, response: Any) -> Dict[str, int]:
+    def _extract_anthropic_tokens(self, response: Any) -> "TokenCounts":
         """Extract tokens from Anthropic response format."""
-        tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-        
         # Anthropic uses different field names
         if hasattr(response, 'usage') and response.usage:
             usage = response.usage
-            tokens["prompt_tokens"] = getattr(usage, 'input_tokens', 0)
-            tokens["completion_tokens"] = getattr(usage, 'output_tokens', 0)
-            tokens["total_tokens"] = tokens["prompt_tokens"] + tokens["completion_tokens"]
+            prompt = getattr(usage, 'input_tokens', 0)
+            completion = getattr(usage, 'output_tokens', 0)
+            cache_read = getattr(usage, 'cache_read_input_tokens', None)
+            cache_write = getattr(usage, 'cache_creation_input_tokens', None)
         
         elif isinstance(response, dict):
             usage = response.get('usage', {})
-            tokens["prompt_tokens"] = usage.get('input_tokens', 0)
-            tokens["completion_tokens"] = usage.get('output_tokens', 0)
-            tokens["total_tokens"] = tokens["prompt_tokens"] + tokens["completion_tokens"]
-            
-        return tokens
+            prompt = usage.get('input_tokens', 0)
+            completion = usage.get('output_tokens', 0)
+            cache_read = usage.get('cache_read_input_tokens')
+            cache_write = usage.get('cache_creation_input_tokens')
+        
+        else:
+            return _NO_TOKENS
+        
+        if cache_read is None and cache_write is None:
+            return TokenCounts(prompt, completion, prompt + completion)
+        
+        # Anthropic reports cache reads and writes separately from input_tokens,
+        # so fold them into the prompt total and keep reads as the cached share
+        cached = cache_read or 0
+        uncached = prompt + (cache_write or 0)
+        prompt = uncached + cached
+        return TokenCounts(prompt, completion, prompt + completion, cached, uncached)
     
-    def _extract_ollama_tokens(self, response: Any) -> Dict[str, int]:
+    def _extract_ollama_tokens(self, response: Any) -> "TokenCounts":
         """Extract tokens from Ollama response format."""
-        tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        prompt = completion = 0
         
         # Ollama may provide token counts in different formats
         if hasattr(response, 'eval_count'):
-            tokens["completion_tokens"] = getattr(response, 'eval_count', 0)
+            completion = getattr(response, 'eval_count', 0)
         if hasattr(response, 'prompt_eval_count'):
-            tokens["prompt_tokens"] = getattr(response, 'prompt_eval_count', 0)
+            prompt = getattr(response, 'prompt_eval_count', 0)
             
         elif isinstance(response, dict):
-            tokens["prompt_tokens"] = response.get('prompt_eval_count', 0)
-            tokens["completion_tokens"] = response.get('eval_count', 0)
+            prompt = response.get('prompt_eval_count', 0)
+            completion = response.get('eval_count', 0)
             
-        tokens["total_tokens"] = tokens["prompt_tokens"] + tokens["completion_tokens"]
-        return tokens
+        return TokenCounts(prompt, completion, prompt + completion)
     
-    def _extract_generic_tokens(self, response: Any) -> Dict[str, int]:
+    def _extract_generic_tokens(self, response: Any) -> "TokenCounts":
         """Try to extract tokens from unknown provider format."""
-        tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-        
-        # Common field names to check
-        token_fields = [
-            ('prompt_tokens', ['prompt_tokens', 'input_tokens', 'prompt_eval_count']),
-            ('completion_tokens', ['completion_tokens', 'output_tokens', 'eval_count']),
-            ('total_tokens', ['total_tokens', 'total'])
-        ]
-        
-        for token_type, field_names in token_fields:
-            for field_name in field_names:
-                # Check object attributes
-                if hasattr(response, field_name):
-                    tokens[token_type] = getattr(response, field_name, 0)
-                    break
-                # Check dictionary keys
-                elif isinstance(response, dict) and field_name in response:
-                    tokens[token_type] = response[field_name]
-                    break
-                # Check nested usage object
-                elif hasattr(response, 'usage') and hasattr(response.usage, field_name):
-                    tokens[token_type] = getattr(response.usage, field_name, 0)
-                    break
-                elif isinstance(response, dict) and 'usage' in response and field_name in response['usage']:
-                    tokens[token_type] = response['usage'][field_name]
-                    break
+        # Resolve the top-level and nested usage lookups once, for dicts or objects
+        if isinstance(response, dict):
+            usage = response.get('usage')
+            getters = [response.get]
+            if isinstance(usage, dict):
+                getters.append(usage.get)
+        else:
+            usage = getattr(response, 'usage', None)
+            getters = [functools.partial(getattr, response)]
+            if usage is not None:
+                getters.append(functools.partial(getattr, usage))
+        
+        # First non-zero value wins, checking each field name on the response then its usage
+        prompt, completion, total = (
+            next(
+                (value for field_name in field_names for get in getters
+                 for value in (get(field_name, None),) if value),
+                0
+            )
+            for field_names in _FIELD_MAP.values()
+        )
         
         # Calculate total if not provided
-        if not tokens["total_tokens"] and (tokens["prompt_tokens"] or tokens["completion_tokens"]):
-            tokens["total_tokens"] = tokens["prompt_tokens"] + tokens["completion_tokens"]
+        if not total and (prompt or completion):
+            total = prompt + completion
             
-        return tokens
+        return TokenCounts(prompt, completion, total)
+    
+    # Provider-specific extractors (plain functions, called with the counter as first argument)
+    _DISPATCH = {
+        "OPENAI": _extract_openai_tokens,
+        "ANTHROPIC": _extract_anthropic_tokens,
+        "OLLAMA": _extract_ollama_tokens,
+    }
     
     def estimate_tokens(self, text: str, method: str = "tiktoken") -> int:
         """
@@ -182,15 +253,36 @@ class TokenCounter:
                     logger.warning(f"tiktoken encoding failed: {e}, falling back to character method")
                     
         if method == "chars" or method == "tiktoken":  # fallback from tiktoken
-            return max(1, len(text) // AVG_CHARS_PER_TOKEN)
+            return (len(text) + AVG_CHARS_PER_TOKEN - 1) >> _LOG2_CHARS_PER_TOKEN  # ceil, so >= 1
             
         elif method == "words":
-            word_count = len(text.split())
+            word_count = sum(1 for _ in _WORD_RE.finditer(text))
             return max(1, int(word_count * AVG_WORDS_TO_TOKENS))
             
         else:
             logger.warning(f"Unknown estimation method '{method}', using character-based")
-            return max(1, len(text) // AVG_CHARS_PER_TOKEN)
+            return (len(text) + AVG_CHARS_PER_TOKEN - 1) >> _LOG2_CHARS_PER_TOKEN  # ceil, so >= 1
+    
+    def _encode_many(self, texts: List[str]) -> List[int]:
+        """
+        Count tokens for several texts with one encoder lookup.
+        
+        Each text is encoded directly; tiktoken's batch API starts a thread pool per
+        call, which costs more than it saves for the prompt/completion pair used here.
+        
+        Args:
+            texts: Non-empty texts to count
+            
+        Returns:
+            Token count per text, in the same order
+        """
+        encoder = self.get_tiktoken_encoder()
+        if encoder:
+            try:
+                return [len(encoder.encode_ordinary(text)) for text in texts]
+            except Exception as e:
+                logger.warning(f"tiktoken encoding failed: {e}, falling back to character method")
+        return [self.estimate_tokens(text, method="chars") for text in texts]
     
     def get_completion_tokens_from_streaming(self, full_response: str) -> int:
         """
@@ -204,6 +296,15 @@ class TokenCounter:
         """
         return self.estimate_tokens(full_response, method="tiktoken")
     
+    def streaming_counter(self) -> "StreamingTokenCounter":
+        """
+        Create an incremental completion token counter for a streamed response.
+        
+        Returns:
+            StreamingTokenCounter using the shared tiktoken encoder when available
+        """
+        return StreamingTokenCounter(self.get_tiktoken_encoder())
+    
     def calculate_token_counts(self, 
                              prompt_text: str = None, 
                              completion_text: str = None,
@@ -219,32 +320,135 @@ class TokenCounter:
         Returns:
             Dict with prompt_tokens, completion_tokens, total_tokens
         """
-        tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-        
-        # First try to extract from response object
-        if response_obj:
-            extracted = self.extract_tokens_from_response(response_obj)
-            if extracted["total_tokens"] > 0:  # Got actual counts
-                return extracted
-            else:
-                tokens.update(extracted)  # May have partial counts
-        
-        # Estimate missing counts from text
-        if prompt_text and tokens["prompt_tokens"] == 0:
-            tokens["prompt_tokens"] = self.estimate_tokens(prompt_text)
-            
-        if completion_text and tokens["completion_tokens"] == 0:
-            tokens["completion_tokens"] = self.estimate_tokens(completion_text)
+        return self._calculate(prompt_text, completion_text, response_obj).as_dict()
+    
+    def _calculate(self, prompt_text: str, completion_text: str, response_obj: Any) -> "TokenCounts":
+        """Token counts for calculate_token_counts, without building the public dict."""
+        # First try to extract from response object; actual counts win outright
+        counts = self._extract_counts(response_obj) if response_obj else _NO_TOKENS
+        if counts.total > 0:
+            return counts
+        
+        # Otherwise keep any partial counts and estimate the rest from text
+        prompt, completion = counts.prompt, counts.completion
+        need_prompt = bool(prompt_text) and prompt == 0
+        need_completion = bool(completion_text) and completion == 0
+        
+        if not (need_prompt or need_completion):
+            return counts._replace(total=prompt + completion) if prompt or completion else counts
+        
+        # Estimate missing counts with a single encoder lookup
+        texts = [prompt_text] if need_prompt else []
+        if need_completion:
+            texts.append(completion_text)
+        estimated = iter(self._encode_many(texts))
+        if need_prompt:
+            prompt = next(estimated)
+        if need_completion:
+            completion = next(estimated)
             
         # Calculate total
-        tokens["total_tokens"] = tokens["prompt_tokens"] + tokens["completion_tokens"]
+        return counts._replace(prompt=prompt, completion=completion, total=prompt + completion)
+
+
+class StreamingTokenCounter:
+    """
+    Incremental token counter for streamed completions.
+    
+    Each delta is encoded once as it arrives instead of re-encoding the accumulated
+    response. The tail of the text is held back and only encoded up to the last
+    space that follows a non-whitespace character, which is always a pre-token
+    boundary, so BPE merges are not split across chunk boundaries.
+    """
+    
+    # Characters kept unencoded at the end of the buffer until more text arrives
+    HOLDBACK_CHARS = 16
+    # Text with no safe split point (CJK, base64, long code) is flushed past this size
+    MAX_BUFFER_CHARS = 4096
+    
+    def __init__(self, encoder=None):
+        """
+        Initialize streaming counter.
         
-        return tokens
+        Args:
+            encoder: tiktoken encoder; None falls back to character-based estimation
+        """
+        self._encoder = encoder
+        self._buffer = ""
+        self._count = 0
+        self._chars = 0
+    
+    def feed(self, delta: str) -> None:
+        """
+        Add a streamed text delta to the count.
+        
+        Args:
+            delta: Newly received completion text
+        """
+        if not delta:
+            return
+        
+        if self._encoder is None:
+            self._chars += len(delta)
+            return
+        
+        text = self._buffer + delta
+        # Too short to split; a negative rfind end would count from the right
+        if len(text) <= self.HOLDBACK_CHARS:
+            self._buffer = text
+            return
+
+        cut = self._split_point(text, len(text) - self.HOLDBACK_CHARS)
+        if cut <= 0:
+            if len(text) <= self.MAX_BUFFER_CHARS:
+                self._buffer = text
+                return
+            # Bound the buffer (and the rescans) at the cost of possibly one extra token
+            cut = len(text) - self.HOLDBACK_CHARS
+        
+        self._count += len(self._encoder.encode_ordinary(text[:cut]))
+        self._buffer = text[cut:]
+    
+    @staticmethod
+    def _split_point(text: str, end: int) -> int:
+        """
+        Find the last safe place to split text before end.
+        
+        Args:
+            text: Buffered text
+            end: Exclusive upper bound for the split index
+            
+        Returns:
+            Index of the last space before end that follows a non-whitespace character, or -1
+        """
+        cut = text.rfind(" ", 0, end)
+        # Inside a whitespace run the tokenizer may merge across the split (e.g. "\n\n")
+        while cut > 0 and text[cut - 1].isspace():
+            cut = text.rfind(" ", 0, cut)
+        return cut
+    
+    def finalize(self) -> int:
+        """
+        Flush the held-back text and return the total token count.
+        
+        Returns:
+            Completion token count for everything fed so far
+        """
+        if self._encoder is None:
+            return (self._chars + AVG_CHARS_PER_TOKEN - 1) >> _LOG2_CHARS_PER_TOKEN
+        
+        if self._buffer:
+            self._count += len(self._encoder.encode_ordinary(self._buffer))
+            self._buffer = ""
+        return self._count
 
 
+@functools.lru_cache(maxsize=None)
 def get_token_counter(provider: str = None) -> TokenCounter:
     """
-    Get a token counter instance for the specified provider.
+    Get the shared token counter instance for the specified provider.
+    
+    TokenCounter holds no per-call state, so one instance per provider is reused.
     
     Args:
         provider: LLM provider name
@@ -272,13 +476,21 @@ def add_token_counts_to_span(span: Any,
     """
     try:
         counter = get_token_counter(provider)
-        tokens = counter.calculate_token_counts(prompt_text, completion_text, response_obj)
+        tokens = counter._calculate(prompt_text, completion_text, response_obj)
+        
+        # Add OpenInference standard token attributes in one update
+        attributes = {
+            SpanAttributes.LLM_TOKEN_COUNT_PROMPT: tokens.prompt,
+            SpanAttributes.LLM_TOKEN_COUNT_COMPLETION: tokens.completion,
+            SpanAttributes.LLM_TOKEN_COUNT_TOTAL: tokens.total,
+        }
+        
+        # Prompt-cache split, only when the provider reported it
+        if tokens.cached is not None:
+            attributes[SpanAttributes.LLM_TOKEN_COUNT_PROMPT_CACHED] = tokens.cached
+            attributes[SpanAttributes.LLM_TOKEN_COUNT_PROMPT_UNCACHED] = tokens.uncached_prompt
         
-        # Add OpenInference standard token attributes
-        from backend.telemetry.constants import SpanAttributes
-        span.set_attribute(SpanAttributes.LLM_TOKEN_COUNT_PROMPT, tokens["prompt_tokens"])
-        span.set_attribute(SpanAttributes.LLM_TOKEN_COUNT_COMPLETION, tokens["completion_tokens"])
-        span.set_attribute(SpanAttributes.LLM_TOKEN_COUNT_TOTAL, tokens["total_tokens"])
+        span.set_attributes(attributes)
         
         # Log for debugging
         logger.debug(f"Added token counts to span: {tokens} (provider: {provider})")
@@ -12,8 +12,10 @@ This script generates a complete Darwin retriever with all advanced features:
 The generated retriever matches the full functionality of the working darwin_retriever.py
 and integrates seamlessly with the ATLAS frontend.
 """
+import importlib.util
 import os
 import re
+import string
 import sys
 from pathlib import Path
 import argparse
@@ -31,25 +33,28 @@ if str(repo_root) not in sys.path:
 
 from backend.retrievers.base_retriever import BaseRetriever
 
+# Manifest fields extracted from the Darwin letters stats file, matched in one pass
+_MANIFEST_RE = re.compile(
+    r'^(?P<key>Collection|Model|Chunk Size|Chunk Overlap|Created|Text Splitter):\s*(?P<val>.+)$',
+    re.M
+)
+_MANIFEST_KEYS = {
+    'Collection': 'COLLECTION_NAME',
+    'Model': 'EMBEDDING_MODEL',
+    'Chunk Size': 'CHUNK_SIZE',
+    'Chunk Overlap': 'CHUNK_OVERLAP',
+    'Created': 'CREATED',
+    'Text Splitter': 'TEXT_SPLITTER',
+}
+
 def parse_manifest_file(manifest_path):
     config = {}
     try:
-        with open(manifest_path, 'r') as f:
-            content = f.read()
-            # Extract key parameters from Darwin letters stats file
-            collection_match = re.search(r'Collection:\s*(.+)', content)
-            model_match = re.search(r'Model:\s*(.+)', content)
-            chunk_size_match = re.search(r'Chunk Size:\s*(\d+)', content)
-            chunk_overlap_match = re.search(r'Chunk Overlap:\s*(\d+)', content)
-            created_match = re.search(r'Created:\s*(.+)', content)
-            text_splitter_match = re.search(r'Text Splitter:\s*(.+)', content)
-            
-            if collection_match: config['COLLECTION_NAME'] = collection_match.group(1).strip()
-            if model_match: config['EMBEDDING_MODEL'] = model_match.group(1).strip()
-            if chunk_size_match: config['CHUNK_SIZE'] = chunk_size_match.group(1)
-            if chunk_overlap_match: config['CHUNK_OVERLAP'] = chunk_overlap_match.group(1)
-            if created_match: config['CREATED'] = created_match.group(1).strip()
-            if text_splitter_match: config['TEXT_SPLITTER'] = text_splitter_match.group(1).strip()
+        with open(manifest_path, 'rb') as f:
+            content = f.read().decode('utf-8', 'replace')
+        # Extract key parameters from Darwin letters stats file; the first occurrence wins
+        for match in _MANIFEST_RE.finditer(content):
+            config.setdefault(_MANIFEST_KEYS[match.group('key')], match.group('val').strip())
     except Exception as e:
         print(f"Error parsing manifest: {e}")
         sys.exit(1)
@@ -64,31 +69,53 @@ def parse_manifest_file(manifest_path):
 def generate_atlas_retriever(config, output_path):
     """Generate enhanced Darwin retriever using the working template."""
     # Use the enhanced generator instead of the old basic template
-    import subprocess
-    
     enhanced_script = Path(__file__).parent / "create_darwin_retriever_enhanced.py"
     if enhanced_script.exists():
         print("🔄 Using enhanced retriever generator...")
-        result = subprocess.run([sys.executable, str(enhanced_script)], capture_output=True, text=True)
-        if result.returncode == 0:
-            print("✅ Enhanced retriever generated successfully!")
-            return
+        # Run it in this interpreter; a subprocess would cold-start Python and re-import everything
+        try:
+            spec = importlib.util.spec_from_file_location("create_darwin_retriever_enhanced", enhanced_script)
+            enhanced = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(enhanced)
+        except Exception as e:
+            print(f"⚠️ Could not import enhanced generator ({e}), running it as a subprocess...")
+            enhanced = None
+        
+        if enhanced is not None:
+            try:
+                enhanced.main(config, output_path)
+                print("✅ Enhanced retriever generated successfully!")
+                return
+            except (Exception, SystemExit) as e:
+                print(f"❌ Enhanced generator failed: {e}")
+                print("🔄 Falling back to basic template...")
         else:
-            print(f"❌ Enhanced generator failed: {result.stderr}")
-            print("🔄 Falling back to basic template...")
+            import subprocess
+            result = subprocess.run([sys.executable, str(enhanced_script)], capture_output=True, text=True)
+            if result.returncode == 0:
+                print("✅ Enhanced retriever generated successfully!")
+                return
+            else:
+                print(f"❌ Enhanced generator failed: {result.stderr}")
+                print("🔄 Falling back to basic template...")
     
     # Fallback to basic template (original code)
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     template = '''#!/usr/bin/env python3
 """
 Auto-generated ATLAS Retriever for Darwin Corpus
-Generated: {now}
-Manifest creation: {CREATED}
+Generated: ${now}
+Manifest creation: ${CREATED}
 """
 import os
+import json
+import hashlib
 import logging
 import asyncio
+import threading
+from dataclasses import asdict, dataclass
 from typing import Dict, List, Any, Optional, Tuple
+from cachetools import TTLCache
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents.base import Document
@@ -96,58 +123,145 @@ from backend.retrievers.base_retriever import BaseRetriever
 
 logger = logging.getLogger(__name__)
 
+# Search results are reused for identical (query, k, filter) requests for a short
+# while; the TTL bounds staleness after the collection is rebuilt
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL_SECONDS = 600
+
 # Define direction filter options
 DIRECTION_OPTIONS = [
-    {{"value": "all", "label": "All Letters"}},
-    {{"value": "sent", "label": "Sent by Darwin"}},
-    {{"value": "received", "label": "Received by Darwin"}}
+    {"value": "all", "label": "All Letters"},
+    {"value": "sent", "label": "Sent by Darwin"},
+    {"value": "received", "label": "Received by Darwin"}
 ]
 
 # Define time period options
 TIME_PERIOD_OPTIONS = [
-    {{"value": "all", "label": "All Years"}},
-    {{"value": "1821-1840", "label": "Early Years (1821-1840)"}},
-    {{"value": "1831-1850", "label": "Voyage & Development (1831-1850)"}},
-    {{"value": "1850-1870", "label": "Origin Period (1850-1870)"}},
-    {{"value": "1870-1882", "label": "Later Years (1870-1882)"}}
+    {"value": "all", "label": "All Years"},
+    {"value": "1821-1840", "label": "Early Years (1821-1840)"},
+    {"value": "1831-1850", "label": "Voyage & Development (1831-1850)"},
+    {"value": "1850-1870", "label": "Origin Period (1850-1870)"},
+    {"value": "1870-1882", "label": "Later Years (1870-1882)"}
 ]
 
+# Chroma filters for the fixed direction and time period options, built once
+DIRECTION_FILTERS = {
+    "sent": {"sender_name": "Darwin, C. R."},  # Letters sent by Darwin (Darwin is sender)
+    "received": {"recipient_name": "Darwin, C. R."},  # Letters received by Darwin (Darwin is recipient)
+}
+
+
+def _year_range_filter(start_year: int, end_year: int) -> Dict[str, Any]:
+    return {"$$and": [
+        {"year": {"$$gte": start_year}},
+        {"year": {"$$lte": end_year}}
+    ]}
+
+
+TIME_PERIOD_FILTERS = {
+    option["value"]: _year_range_filter(*map(int, option["value"].split("-")))
+    for option in TIME_PERIOD_OPTIONS
+    if option["value"] != "all"
+}
+
+
+
+@dataclass(slots=True)
+class LetterHit:
+    """One similar_search result, converted to a plain dict at the public API."""
+    id: str
+    content: str
+    letter_id: str
+    sender_name: str
+    recipient_name: str
+    sender_place: str
+    date_sent: str
+    year: Any
+    abstract: str
+    chunk_index: int
+    total_chunks: int
+    source_file: str
+    corpus: str
+
 
 class DarwinRetriever(BaseRetriever):
     """Darwin corpus retriever implementation for ATLAS."""
+    # Embedding models shared by every retriever instance in the process, keyed by model name
+    _EMBEDDER_CACHE: Dict[str, HuggingFaceEmbeddings] = {}
+    _EMBEDDER_LOCK = threading.Lock()
+
     def __init__(self, config: Dict[str, Any] = None):
         if config is None:
-            config = {{}}
+            config = {}
         
         config["DIRECTION_OPTIONS"] = DIRECTION_OPTIONS
         config["TIME_PERIOD_OPTIONS"] = TIME_PERIOD_OPTIONS
         super().__init__(config)
         
-        self.collection_name = "{COLLECTION_NAME}"
-        self.chunk_size = "{CHUNK_SIZE}"
-        self.chunk_overlap = "{CHUNK_OVERLAP}"
-        self.embedding_model = "{EMBEDDING_MODEL}"
+        self.collection_name = "${COLLECTION_NAME}"
+        self.chunk_size = "${CHUNK_SIZE}"
+        self.chunk_overlap = "${CHUNK_OVERLAP}"
+        self.embedding_model = "${EMBEDDING_MODEL}"
         self._supports_direction_filtering = True
         self._supports_time_period_filtering = True
 
         # Location of the persisted Chroma DB
         self.persist_directory = os.getenv("CHROMA_PERSIST_DIRECTORY", "./create/letters/output/chroma_db")
+        self._search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL_SECONDS)
+        self._search_cache_lock = threading.Lock()
         self._initialize_vector_store()
 
+    @staticmethod
+    def _create_embeddings(model_name: str) -> HuggingFaceEmbeddings:
+        """
+        Load the embedding model on CUDA when available, otherwise on CPU.
+        """
+        device = "cpu"
+        try:
+            import torch  # type: ignore
+            if getattr(torch, "cuda", None) and torch.cuda.is_available():
+                device = "cuda"
+        except Exception:
+            device = "cpu"
+
+        model_kwargs = {"device": device}
+
+        # Match the store build, which indexed normalized embeddings
+        encode_kwargs = {"normalize_embeddings": True, "batch_size": 64}
+        try:
+            return HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs=model_kwargs,
+                encode_kwargs=encode_kwargs
+            )
+        except Exception as e:
+            # Fallback to plain CPU for any device-related initialization error
+            logger.warning(f"Embeddings init failed with {model_kwargs}: {e}. Falling back to CPU.")
+            return HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={"device": "cpu"},
+                encode_kwargs=encode_kwargs
+            )
+
     def _initialize_vector_store(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name=self.embedding_model)
+        cache = DarwinRetriever._EMBEDDER_CACHE
+        with DarwinRetriever._EMBEDDER_LOCK:
+            embeddings = cache.get(self.embedding_model)
+            if embeddings is None:
+                embeddings = cache[self.embedding_model] = self._create_embeddings(self.embedding_model)
+        self.embeddings = embeddings
         self.vector_store = Chroma(
             collection_name=self.collection_name,
             embedding_function=self.embeddings,
             persist_directory=self.persist_directory,
         )
-        self._retriever = self.vector_store.as_retriever(search_type="similarity", search_kwargs={{"k": 10}})
+        self._retriever = self.vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 10})
 
     def get_retriever(self):
         return self._retriever
 
     def get_config(self) -> Dict[str, Any]:
-        return {{
+        return {
             "collection_name": self.collection_name,
             "chunk_size": self.chunk_size,
             "chunk_overlap": self.chunk_overlap,
@@ -155,7 +269,7 @@ class DarwinRetriever(BaseRetriever):
             "persist_directory": self.persist_directory,
             "supports_direction_filtering": self._supports_direction_filtering,
             "supports_time_period_filtering": self._supports_time_period_filtering,
-        }}
+        }
 
     @property
     def supports_direction_filtering(self) -> bool:
@@ -178,28 +292,25 @@ class DarwinRetriever(BaseRetriever):
         
         # Direction filter: sent by Darwin or received by Darwin
         if direction_filter and direction_filter != "all":
-            if direction_filter == "sent":
-                # Letters sent by Darwin (Darwin is sender)
-                filter_conditions.append({{"sender_name": "Darwin, C. R."}})
-            elif direction_filter == "received":
-                # Letters received by Darwin (Darwin is recipient)
-                filter_conditions.append({{"recipient_name": "Darwin, C. R."}})
+            direction_condition = DIRECTION_FILTERS.get(direction_filter)
+            if direction_condition is not None:
+                filter_conditions.append(direction_condition)
         
-        # Time period filter
+        # Time period filter: the listed options are prebuilt; parse anything else
         if time_period_filter and time_period_filter != "all":
-            if "-" in time_period_filter:  # Range like "1850-1870"
+            period_condition = TIME_PERIOD_FILTERS.get(time_period_filter)
+            if period_condition is not None:
+                filter_conditions.append(period_condition)
+            elif "-" in time_period_filter:  # Range like "1850-1870"
                 try:
                     start_year, end_year = map(int, time_period_filter.split("-"))
-                    filter_conditions.append({{"$and": [
-                        {{"year": {{"$gte": start_year}}}},
-                        {{"year": {{"$lte": end_year}}}}
-                    ]}})
+                    filter_conditions.append(_year_range_filter(start_year, end_year))
                 except ValueError:
                     pass
             else:  # Specific year
                 try:
                     year = int(time_period_filter)
-                    filter_conditions.append({{"year": year}})
+                    filter_conditions.append({"year": year})
                 except ValueError:
                     pass
         
@@ -207,7 +318,7 @@ class DarwinRetriever(BaseRetriever):
             if len(filter_conditions) == 1:
                 return filter_conditions[0]
             else:
-                return {{"$and": filter_conditions}}
+                return {"$$and": filter_conditions}
         
         return None
 
@@ -215,31 +326,36 @@ class DarwinRetriever(BaseRetriever):
                       direction_filter: Optional[str] = None,
                       time_period_filter: Optional[str] = None) -> List[Dict[str, Any]]:
         """Search for similar documents with optional filtering."""
-        logger.info(f"similar_search: k={{k}}, direction_filter={{direction_filter}}, time_period_filter={{time_period_filter}}")
+        logger.info(f"similar_search: k={k}, direction_filter={direction_filter}, time_period_filter={time_period_filter}")
         
         filter_dict = self._build_filter_dict(direction_filter, time_period_filter)
         
         # Use standard similarity search
         docs = self.vector_store.similarity_search(query=query, k=k, filter=filter_dict)
-        return [{{
-            "id": doc.metadata.get("letter_id", "unknown"),
-            "content": doc.page_content,
-            "letter_id": doc.metadata.get("letter_id", "unknown"),
-            "sender_name": doc.metadata.get("sender_name", "unknown"),
-            "recipient_name": doc.metadata.get("recipient_name", "unknown"),
-            "sender_place": doc.metadata.get("sender_place", "unknown"),
-            "date_sent": doc.metadata.get("date_sent", "unknown"),
-            "year": doc.metadata.get("year", "unknown"),
-            "abstract": doc.metadata.get("abstract", ""),
-            "chunk_index": doc.metadata.get("chunk_index", 0),
-            "total_chunks": doc.metadata.get("total_chunks", 1),
-            "source_file": doc.metadata.get("source_file", "unknown"),
-            "corpus": doc.metadata.get("corpus", "darwin_letters")
-        }} for doc in docs]
+        hits = []
+        for doc in docs:
+            get = doc.metadata.get
+            letter_id = get("letter_id", "unknown")
+            hits.append(LetterHit(
+                id=letter_id,
+                content=doc.page_content,
+                letter_id=letter_id,
+                sender_name=get("sender_name", "unknown"),
+                recipient_name=get("recipient_name", "unknown"),
+                sender_place=get("sender_place", "unknown"),
+                date_sent=get("date_sent", "unknown"),
+                year=get("year", "unknown"),
+                abstract=get("abstract", ""),
+                chunk_index=get("chunk_index", 0),
+                total_chunks=get("total_chunks", 1),
+                source_file=get("source_file", "unknown"),
+                corpus=get("corpus", "darwin_letters"),
+            ))
+        # Same List[Dict] shape as the other retrievers, so subscripting callers keep working
+        return [asdict(hit) for hit in hits]
     
-    # LangChain-compatible async implementation
-    async def _get_relevant_documents(self, query: str, config: Optional[Dict] = None, **kwargs) -> List[Document]:
-        """Internal implementation method called by invoke/ainvoke"""
+    def _sync_search(self, query: str, config: Optional[Dict] = None, **kwargs) -> List[Document]:
+        """Run the filtered similarity search shared by the sync and async entry points."""
         k = kwargs.get("k", 10)
         direction_filter = None
         time_period_filter = None
@@ -251,14 +367,34 @@ class DarwinRetriever(BaseRetriever):
         
         filter_dict = self._build_filter_dict(direction_filter, time_period_filter)
         
+        # Identical searches within the TTL skip both the query embedding and the Chroma lookup
+        cache_key = self._search_cache_key(query, k, filter_dict)
+        with self._search_cache_lock:
+            cached = self._search_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
         # Use standard similarity search
-        return self.vector_store.similarity_search(query=query, k=k, filter=filter_dict)
+        docs = self.vector_store.similarity_search(query=query, k=k, filter=filter_dict)
+        with self._search_cache_lock:
+            self._search_cache[cache_key] = docs
+        return list(docs)
+    
+    @staticmethod
+    def _search_cache_key(query: str, k: int, filter_dict: Optional[Dict[str, Any]]) -> str:
+        """Hash the inputs that determine a similarity search result."""
+        payload = json.dumps([query, k, filter_dict], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    # LangChain-compatible async implementation
+    async def _get_relevant_documents(self, query: str, config: Optional[Dict] = None, **kwargs) -> List[Document]:
+        """Internal implementation method called by ainvoke; the blocking search runs in a worker thread."""
+        return await asyncio.to_thread(self._sync_search, query, config, **kwargs)
     
     # Public API methods required by LangChain
     def invoke(self, input: str, config: Optional[Dict] = None, **kwargs) -> List[Document]:
         """Synchronous invoke method required by LangChain."""
-        import asyncio
-        return asyncio.run(self._get_relevant_documents(input, config, **kwargs))
+        return self._sync_search(input, config, **kwargs)
     
     async def ainvoke(self, input: str, config: Optional[Dict] = None, **kwargs) -> List[Document]:
         """Asynchronous invoke method required by LangChain."""
@@ -270,19 +406,19 @@ def format_document_for_citation(document: Document, idx: Optional[int] = None)
     if not document:
         return None
 
-    meta = getattr(document, 'metadata', {{}}) or {{}}
+    meta = getattr(document, 'metadata', {}) or {}
     text = getattr(document, 'page_content', str(document))
 
     preview = text[:300] + ("..." if len(text) > 300 else "")
-    doc_id = meta.get("letter_id") or meta.get("id") or (f"letter_{{idx}}" if idx is not None else "unknown")
+    doc_id = meta.get("letter_id") or meta.get("id") or (f"letter_{idx}" if idx is not None else "unknown")
 
     # Create a more informative title for letters
     sender = meta.get("sender_name", "Unknown")
     recipient = meta.get("recipient_name", "Unknown")
     date = meta.get("date_sent", "Unknown date")
-    title = f"Letter from {{sender}} to {{recipient}} ({{date}})"
+    title = f"Letter from {sender} to {recipient} ({date})"
 
-    return {{
+    return {
         "id": doc_id,
         "source_id": doc_id,
         "title": title,
@@ -301,15 +437,19 @@ def format_document_for_citation(document: Document, idx: Optional[int] = None)
         "quote": preview,
         "content": text,
         "full_content": text,
-        "loc": f"Chunk {{meta.get('chunk_index', 0) + 1}} of {{meta.get('total_chunks', 1)}}",
+        "loc": f"Chunk {meta.get('chunk_index', 0) + 1} of {meta.get('total_chunks', 1)}",
         "weight": 1.0,
         "has_more": len(text) > 300,
-    }}
+    }
 '''
     cfg = config.copy()
     cfg['now'] = now
+    # $-placeholders leave the template's own braces alone, so manifest values containing
+    # braces cannot break substitution; compiling first surfaces template errors here
+    code = string.Template(template).safe_substitute(cfg)
+    compile(code, output_path, 'exec')
     with open(output_path, 'w') as f:
-        f.write(template.format(**cfg))
+        f.write(code)
     os.chmod(output_path, 0o755)
     print(f"Generated ATLAS retriever: {output_path}")
 
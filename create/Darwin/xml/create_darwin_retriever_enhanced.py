@@ -12,35 +12,60 @@ This script generates a complete Darwin retriever with all advanced features:
 The generated retriever matches the full functionality of the working darwin_retriever.py
 and integrates seamlessly with the ATLAS frontend.
 """
+import functools
+import hashlib
+import mmap
 import os
 import re
 import sys
 import shutil
-from pathlib import Path
+from contextlib import contextmanager
 from datetime import datetime
 
+# Repository paths, resolved once at import
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+_MANIFEST_PATH = os.path.join(_REPO_ROOT, "backend", "targets", "darwin.txt")
+_SOURCE_RETRIEVER = os.path.join(_REPO_ROOT, "backend", "retrievers", "darwin_retriever.py")
+_DEFAULT_OUTPUT = os.path.join(_REPO_ROOT, "create", "Darwin", "xml", "output", "darwin_retriever.py")
+
+# Buffer size for reading the manifest and streaming the source retriever to the output
+_COPY_BUFFER_SIZE = 65536
+
+# Manifest line keys mapped to config keys
+KEY_MAP = {
+    'Collection': 'COLLECTION_NAME',
+    'Model': 'EMBEDDING_MODEL',
+    'Chunk Size': 'CHUNK_SIZE',
+    'Chunk Overlap': 'CHUNK_OVERLAP',
+    'Created': 'CREATED',
+    'Text Splitter': 'TEXT_SPLITTER',
+    'Pooling Strategy': 'POOLING',
+}
+
 def parse_manifest_file(manifest_path):
     """Parse the Darwin vector store manifest to extract configuration."""
+    try:
+        st = os.stat(manifest_path)
+    except FileNotFoundError:
+        print(f"Error: Manifest file {manifest_path} not found!")
+        sys.exit(1)
+    # Reparse only when the manifest's mtime or size changes
+    return dict(_parse_manifest_cached(os.fspath(manifest_path), st.st_mtime_ns, st.st_size))
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_manifest_cached(manifest_path, mtime_ns, size):
+    """Read and validate the manifest; returns an immutable tuple of config items."""
     config = {}
     try:
-        with open(manifest_path, 'r') as f:
-            content = f.read()
-            # Extract key parameters from Darwin letters stats file
-            collection_match = re.search(r'Collection:\s*(.+)', content)
-            model_match = re.search(r'Model:\s*(.+)', content)
-            chunk_size_match = re.search(r'Chunk Size:\s*(\d+)', content)
-            chunk_overlap_match = re.search(r'Chunk Overlap:\s*(\d+)', content)
-            created_match = re.search(r'Created:\s*(.+)', content)
-            text_splitter_match = re.search(r'Text Splitter:\s*(.+)', content)
-            pooling_match = re.search(r'Pooling Strategy:\s*(.+)', content)
-            
-            if collection_match: config['COLLECTION_NAME'] = collection_match.group(1).strip()
-            if model_match: config['EMBEDDING_MODEL'] = model_match.group(1).strip()
-            if chunk_size_match: config['CHUNK_SIZE'] = chunk_size_match.group(1)
-            if chunk_overlap_match: config['CHUNK_OVERLAP'] = chunk_overlap_match.group(1)
-            if created_match: config['CREATED'] = created_match.group(1).strip()
-            if text_splitter_match: config['TEXT_SPLITTER'] = text_splitter_match.group(1).strip()
-            if pooling_match: config['POOLING'] = pooling_match.group(1).strip()
+        # Extract key parameters from Darwin letters stats file, stopping once all are found
+        with open(manifest_path, 'r', buffering=_COPY_BUFFER_SIZE) as f:
+            for line in f:
+                k, sep, v = line.partition(':')
+                if sep and k in KEY_MAP:
+                    config.setdefault(KEY_MAP[k], v.strip())
+                    if len(config) == len(KEY_MAP):
+                        break
             
     except FileNotFoundError:
         print(f"Error: Manifest file {manifest_path} not found!")
@@ -55,25 +80,20 @@ def parse_manifest_file(manifest_path):
         if k not in config:
             print(f"Missing {k} in manifest!")
             sys.exit(1)
-    return config
+    return tuple(config.items())
 
-def generate_enhanced_retriever(config, source_retriever_path, output_path):
-    """Generate enhanced Darwin retriever by updating the working template."""
-    print(f"📖 Reading source retriever from: {source_retriever_path}")
-    
-    # Read the current working retriever
-    with open(source_retriever_path, 'r') as f:
-        retriever_code = f.read()
-    
-    # Update the configuration values from manifest
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Add generation header
-    header = f'''#!/usr/bin/env python3
+# Template placeholders filled from the manifest, replaced in one regex pass
+_PLACEHOLDER_KEYS = ('COLLECTION_NAME', 'EMBEDDING_MODEL', 'CHUNK_SIZE', 'CHUNK_OVERLAP')
+_PLACEHOLDER_PREFIX = b'"{'
+# Any quoted "{KEY}" placeholder, so unknown keys are caught rather than copied through
+_PLACEHOLDER_RE = re.compile(rb'"\{([A-Z_]+)\}"')
+
+# Generation header swapped in for the source retriever's docstring
+_HEADER_TMPL = '''#!/usr/bin/env python3
 """
 Auto-generated Enhanced Darwin Retriever for ATLAS
 Generated: {now}
-Manifest creation: {config.get('CREATED', 'Unknown')}
+Manifest creation: {created}
 
 This retriever includes:
 - Hybrid search (dense embeddings + BM25 lexical search + RRF fusion)
@@ -84,63 +104,183 @@ This retriever includes:
 - Time period and direction filtering
 """
 '''
-    
-    # Replace the original header with generation info
-    # Find the end of the existing docstring
-    docstring_end = retriever_code.find('"""', retriever_code.find('"""') + 3) + 3
-    if docstring_end > 2:
-        retriever_code = header + retriever_code[docstring_end:]
+
+# Leading docstring of the source retriever (optionally after a shebang), matched in one anchored scan
+_LEADING_DOC_RE = re.compile(rb'\A(?:#![^\n]*\n)?\s*""".*?"""', re.DOTALL)
+
+# Hard-coded persist directory rewritten to honour CHROMA_PERSIST_DIRECTORY
+_PERSIST_MARKER = b'persist_directory = '
+_ENV_MARKER = b'os.getenv'
+_PERSIST_LITERAL = b'persist_directory = "backend/targets/chroma_db"'
+_PERSIST_FROM_ENV = b'persist_directory = os.getenv("CHROMA_PERSIST_DIRECTORY", "backend/targets/chroma_db")'
+
+# Sidecar next to the output recording what it was generated from
+_STAMP_SUFFIX = '.stamp'
+
+# Leading bytes read to locate the source docstring on the streaming path
+_HEAD_SIZE = 4096
+
+
+def _needs_rewrite(source_retriever_path):
+    """Check the whole source for placeholders or a persist-directory rewrite without reading it into memory."""
+    with open(source_retriever_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm.find(_PLACEHOLDER_PREFIX) != -1 and _PLACEHOLDER_RE.search(mm):
+                return True
+            return mm.find(_PERSIST_MARKER) != -1 and mm.find(_ENV_MARKER) == -1
+
+
+def _build_stamp(config, source_retriever_path):
+    """Fingerprint the manifest configuration and the stat info of the source retriever and this generator."""
+    st = os.stat(source_retriever_path)
+    gen = os.stat(__file__)
+    fingerprint = repr((sorted(config.items()), str(source_retriever_path), st.st_mtime_ns, st.st_size,
+                        gen.st_mtime_ns, gen.st_size))
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+
+def _is_up_to_date(output_path, stamp):
+    """Check whether the output exists and was generated from the same inputs."""
+    try:
+        with open(f"{output_path}{_STAMP_SUFFIX}", 'r') as f:
+            return f.read().strip() == stamp and os.path.exists(output_path)
+    except FileNotFoundError:
+        return False
+
+
+@contextmanager
+def _atomic_output(output_path):
+    """Write to an executable temp file next to output_path and move it into place on success."""
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o755)
+    try:
+        with os.fdopen(fd, 'wb', buffering=_COPY_BUFFER_SIZE) as f:
+            yield f
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _write_chunks(f, chunks):
+    """Write several buffers in one writev() call where available, finishing any short write."""
+    if hasattr(os, 'writev'):
+        f.flush()
+        written = os.writev(f.fileno(), chunks)
+        for chunk in chunks:
+            if written >= len(chunk):
+                written -= len(chunk)
+                continue
+            f.write(memoryview(chunk)[written:])
+            written = 0
     else:
-        retriever_code = header + retriever_code
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def generate_enhanced_retriever(config, source_retriever_path, output_path):
+    """Generate enhanced Darwin retriever by updating the working template."""
+    # Skip regeneration when neither the configuration, the source nor this generator changed
+    stamp = _build_stamp(config, source_retriever_path)
+    if _is_up_to_date(output_path, stamp):
+        print(f"✅ Enhanced Darwin retriever is up to date: {output_path}")
+        return
     
-    # Update configuration placeholders if they exist in template format
-    replacements = {
-        '"{COLLECTION_NAME}"': f'"{config["COLLECTION_NAME"]}"',
-        '"{EMBEDDING_MODEL}"': f'"{config["EMBEDDING_MODEL"]}"', 
-        '"{CHUNK_SIZE}"': f'"{config["CHUNK_SIZE"]}"',
-        '"{CHUNK_OVERLAP}"': f'"{config["CHUNK_OVERLAP"]}"',
-    }
+    print(f"📖 Reading source retriever from: {source_retriever_path}")
+    
+    # Update the configuration values from manifest
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    # Add generation header
+    header = _HEADER_TMPL.format(now=now, created=config.get('CREATED', 'Unknown')).encode('utf-8')
+    
+    # Fast path: an already-materialized source only needs its docstring swapped for
+    # the header, so stream the rest straight through without reading it into memory
+    if not _needs_rewrite(source_retriever_path):
+        with open(source_retriever_path, 'rb') as src:
+            head = src.read(_HEAD_SIZE)
+            m = _LEADING_DOC_RE.match(head)
+            if m:
+                print(f"📝 Writing enhanced retriever to: {output_path}")
+                with _atomic_output(output_path) as dst:
+                    dst.write(header)
+                    dst.write(head[m.end():])
+                    shutil.copyfileobj(src, dst, length=_COPY_BUFFER_SIZE)
+                _finish_output(config, output_path, stamp)
+                return
     
-    for placeholder, value in replacements.items():
-        if placeholder in retriever_code:
-            retriever_code = retriever_code.replace(placeholder, value)
+    # Read the current working retriever as bytes; every edit below is ASCII
+    with open(source_retriever_path, 'rb', buffering=_COPY_BUFFER_SIZE) as f:
+        retriever_code = f.read()
+    
+    # Drop the original shebang and docstring; the generation header is written separately
+    m = _LEADING_DOC_RE.match(retriever_code)
+    if m:
+        retriever_code = retriever_code[m.end():]
+    
+    # Update configuration placeholders if they exist in template format, building
+    # replacements only for the keys actually used and refusing to emit unknown ones
+    if _PLACEHOLDER_PREFIX in retriever_code:
+        used = {key.decode() for key in _PLACEHOLDER_RE.findall(retriever_code)}
+        unknown = sorted(used.difference(_PLACEHOLDER_KEYS))
+        if unknown:
+            print(f"❌ Error: Unhandled placeholders in source retriever: {', '.join(unknown)}")
+            sys.exit(1)
+        replacements = {key.encode(): f'"{config[key]}"'.encode('utf-8') for key in used}
+        retriever_code = _PLACEHOLDER_RE.sub(lambda m: replacements[m.group(1)], retriever_code)
     
     # Ensure proper environment variable usage for persist directory
-    if 'persist_directory = ' in retriever_code and 'os.getenv' not in retriever_code:
-        retriever_code = retriever_code.replace(
-            'persist_directory = "backend/targets/chroma_db"',
-            'persist_directory = os.getenv("CHROMA_PERSIST_DIRECTORY", "backend/targets/chroma_db")'
-        )
+    if _PERSIST_MARKER in retriever_code and _ENV_MARKER not in retriever_code:
+        retriever_code = retriever_code.replace(_PERSIST_LITERAL, _PERSIST_FROM_ENV)
     
     print(f"📝 Writing enhanced retriever to: {output_path}")
     
-    # Write the enhanced retriever
-    with open(output_path, 'w') as f:
-        f.write(retriever_code)
+    # Write the enhanced retriever without concatenating header and body
+    with _atomic_output(output_path) as f:
+        _write_chunks(f, (header, retriever_code))
     
-    # Make executable
-    os.chmod(output_path, 0o755)
+    _finish_output(config, output_path, stamp)
+
+
+def _finish_output(config, output_path, stamp):
+    """Record the generated retriever's stamp and report the configuration."""
+    with open(f"{output_path}{_STAMP_SUFFIX}", 'w') as f:
+        f.write(stamp)
     print(f"✅ Enhanced Darwin retriever generated successfully!")
     print(f"💡 Configuration: {config['EMBEDDING_MODEL']}, {config['CHUNK_SIZE']}/{config['CHUNK_OVERLAP']} chunks")
 
-def main():
+def main(config=None, output_path=None):
+    """
+    Generate the enhanced retriever.
+    
+    Args:
+        config: Parsed manifest configuration; defaults to parsing backend/targets/darwin.txt
+        output_path: Destination file; defaults to create/Darwin/xml/output/darwin_retriever.py
+    """
     print("🔨 Enhanced Darwin Retriever Generator")
     
     # Paths
-    repo_root = Path(__file__).resolve().parents[3]
-    manifest_path = repo_root / "backend/targets/darwin.txt"
-    source_retriever = repo_root / "backend/retrievers/darwin_retriever.py"
-    output_path = repo_root / "create/Darwin/xml/output/darwin_retriever.py"
+    manifest_path = _MANIFEST_PATH
+    source_retriever = _SOURCE_RETRIEVER
+    if output_path is None:
+        output_path = _DEFAULT_OUTPUT
+    output_path = os.fspath(output_path)
     
     # Ensure output directory exists
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
     
     # Parse manifest
-    print(f"📖 Reading manifest: {manifest_path}")
-    config = parse_manifest_file(manifest_path)
+    if config is None:
+        print(f"📖 Reading manifest: {manifest_path}")
+        config = parse_manifest_file(manifest_path)
     
     # Check if source retriever exists
-    if not source_retriever.exists():
+    if not os.path.exists(source_retriever):
         print(f"❌ Error: Source retriever not found at {source_retriever}")
         sys.exit(1)
     
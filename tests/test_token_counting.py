@@ -0,0 +1,55 @@
+"""Tests for incremental completion token counting."""
+import pytest
+
+tiktoken = pytest.importorskip("tiktoken")
+
+from backend.telemetry.token_counting import StreamingTokenCounter
+
+# cl100k_base pre-tokenisation over a small byte-level vocabulary, so no encoding download is needed
+_CL100K_PATTERN = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*"""
+    r"""|\s*[\r\n]|\s+(?!\S)|\s+"""
+)
+_MERGES = [b"\n\n", b"  ", b"    ", b" t", b"he", b" the", b"ab", b"abab", b"==", b"Zm", b"9v"]
+
+
+@pytest.fixture(scope="module")
+def encoder():
+    ranks = {bytes([i]): i for i in range(256)}
+    for merge in _MERGES:
+        ranks[merge] = len(ranks)
+    return tiktoken.Encoding(
+        name="test_cl100k_bytes",
+        pat_str=_CL100K_PATTERN,
+        mergeable_ranks=ranks,
+        special_tokens={},
+    )
+
+
+def _stream_count(encoder, text, step):
+    counter = StreamingTokenCounter(encoder)
+    for start in range(0, len(text), step):
+        counter.feed(text[start:start + step])
+    return counter.finalize()
+
+
+@pytest.mark.parametrize("step", [1, 3, 7, 64])
+def test_newlines_and_whitespace_runs_match_full_encode(encoder, step):
+    text = ("def the(x):\n\n    return x  \n\n\n\tthe end\n" * 40) + "x\n\ny"
+    assert _stream_count(encoder, text, step) == len(encoder.encode_ordinary(text))
+
+
+@pytest.mark.parametrize("step", [1, 5, 33])
+def test_whitespace_free_text_matches_full_encode(encoder, step):
+    text = "Zm9vYmFyabab==" * 200
+    assert _stream_count(encoder, text, step) == len(encoder.encode_ordinary(text))
+
+
+def test_whitespace_free_buffer_stays_bounded(encoder):
+    # Unmerged CJK bytes tokenise the same wherever the forced flush cuts
+    text = "自然选择的起源" * 3000
+    counter = StreamingTokenCounter(encoder)
+    for start in range(0, len(text), 11):
+        counter.feed(text[start:start + 11])
+        assert len(counter._buffer) <= StreamingTokenCounter.MAX_BUFFER_CHARS
+    assert counter.finalize() == len(encoder.encode_ordinary(text))